@@ -0,0 +1,139 @@
+"""
+生成プロファイルごとのレイテンシ・トークン使用量を比較するベンチマーク
+
+使用例:
+    python -m app.benchmark_profiles --profiles default concise_json --runs 5
+    python -m app.benchmark_profiles --endpoint analyze_image --image ../tests/backend/fixtures/test_image.jpg
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+from PIL import Image
+
+from .services.vertex_ai import VertexAIService, get_vertex_ai_service
+from .services.diagnose_from_text import (
+    CigaretteType,
+    Gender,
+    SmokingAnalysisRequest,
+    create_diagnosis_prompt
+)
+from .services.diagnose_from_image import create_image_analysis_service
+from .services.generation_profile import (
+    ANALYZE_IMAGE_ENDPOINT,
+    DIAGNOSE_ENDPOINT,
+    GenerationProfile,
+    get_generation_profiles
+)
+
+# ベンチマーク用の代表的な問診データ
+SAMPLE_QUESTIONNAIRE = SmokingAnalysisRequest(
+    current_age=35,
+    gender=Gender.MALE,
+    smoking_start_age=20,
+    daily_cigarettes=20,
+    cigarette_type=CigaretteType.REGULAR,
+    quit_attempts=1,
+    exercise_frequency=1,
+    alcohol_consumption=3,
+    sleep_hours=6.0
+)
+
+
+async def benchmark_profile(
+    vertex_ai_service: VertexAIService,
+    profile: GenerationProfile,
+    contents: Any,
+    runs: int,
+    model_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    1つのプロファイルについてモデル呼び出しを繰り返し計測する
+
+    Args:
+        vertex_ai_service: VertexAIサービスインスタンス
+        profile: 計測する生成プロファイル
+        contents: モデルに渡すコンテンツ
+        runs: 計測回数
+        model_name: 使用するモデル名（省略時はデフォルト）
+
+    Returns:
+        計測結果のサマリー
+    """
+    latencies_ms: List[float] = []
+    output_tokens: List[int] = []
+    thinking_tokens: List[int] = []
+    output_chars: List[int] = []
+
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        text, usage = await vertex_ai_service.generate_content_with_usage(
+            contents,
+            model_name=model_name,
+            profile=profile
+        )
+        latencies_ms.append((time.perf_counter() - started_at) * 1000)
+        output_tokens.append(usage["output_tokens"] or 0)
+        thinking_tokens.append(usage["thinking_tokens"] or 0)
+        output_chars.append(len(text))
+
+    return {
+        "profile": profile.name,
+        "runs": runs,
+        "latency_p50_ms": statistics.median(latencies_ms),
+        "latency_max_ms": max(latencies_ms),
+        "output_tokens_avg": statistics.mean(output_tokens),
+        "thinking_tokens_avg": statistics.mean(thinking_tokens),
+        "output_chars_avg": statistics.mean(output_chars),
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """計測結果を表形式で出力"""
+    header = f"{'profile':<16}{'runs':>6}{'p50(ms)':>10}{'max(ms)':>10}{'out_tok':>10}{'think_tok':>11}{'chars':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['profile']:<16}{result['runs']:>6}"
+            f"{result['latency_p50_ms']:>10.0f}{result['latency_max_ms']:>10.0f}"
+            f"{result['output_tokens_avg']:>10.1f}{result['thinking_tokens_avg']:>11.1f}"
+            f"{result['output_chars_avg']:>8.0f}"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="生成プロファイルのレイテンシ・トークン使用量を比較")
+    parser.add_argument("--endpoint", choices=[DIAGNOSE_ENDPOINT, ANALYZE_IMAGE_ENDPOINT], default=DIAGNOSE_ENDPOINT)
+    parser.add_argument("--profiles", nargs="+", help="比較するプロファイル名（省略時は全プロファイル）")
+    parser.add_argument("--runs", type=int, default=3, help="プロファイルごとの計測回数")
+    parser.add_argument("--model", default=None, help="使用するモデル名")
+    parser.add_argument("--image", default=None, help="analyze_image用の画像ファイルパス")
+    args = parser.parse_args()
+
+    profiles = get_generation_profiles()
+    profile_names = args.profiles or list(profiles.keys())
+
+    vertex_ai_service = get_vertex_ai_service()
+    if args.endpoint == DIAGNOSE_ENDPOINT:
+        contents: Any = create_diagnosis_prompt(SAMPLE_QUESTIONNAIRE)
+    else:
+        if not args.image:
+            parser.error("--endpoint analyze_image には --image が必要です")
+        prompt = create_image_analysis_service(vertex_ai_service)._create_analysis_prompt("smoking_effects")
+        contents = [prompt, Image.open(args.image)]
+
+    results = []
+    for name in profile_names:
+        if name not in profiles:
+            parser.error(f"生成プロファイルが見つかりません: {name}")
+        results.append(
+            await benchmark_profile(vertex_ai_service, profiles[name], contents, args.runs, args.model)
+        )
+
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
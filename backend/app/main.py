@@ -1,8 +1,10 @@
 import logging
 import os
 import uuid
-from typing import Dict, Any
-from fastapi import FastAPI, HTTPException, status, File, UploadFile, Form
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from fastapi import FastAPI, HTTPException, status, File, UploadFile, Form, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, ValidationError, validator
 
@@ -20,14 +22,92 @@ from .services.diagnose_from_image import (
     create_image_analysis_service
 )
 from .services.generate_image import (
-    generate_image_from_prompt
+    generate_image_bytes_from_prompt
+)
+from .services.image_encoding import (
+    OUTPUT_FORMAT_PATTERN,
+    ImageOutputOptions,
+    encode_generated_image_async,
+    shutdown_image_encode_executor
+)
+from .services.model_tier import (
+    get_model_tier_policy
+)
+from .services.generation_profile import (
+    DIAGNOSE_ENDPOINT,
+    ANALYZE_IMAGE_ENDPOINT,
+    GENERATE_IMAGE_ENDPOINT,
+    get_profile_for_endpoint,
+    validate_generation_profiles
+)
+from .services.image_quality import (
+    ImageQualityError,
+    ensure_image_dimensions,
+    ensure_upload_quality_async,
+    get_image_quality_config
+)
+from .services.rate_limit import (
+    get_rate_limiter,
+    resolve_client_ip
+)
+from .services.diagnosis_reuse import (
+    get_diagnosis_reuse_index
+)
+from .services.memory_budget import (
+    MemoryBudgetTimeoutError,
+    estimate_image_request_bytes,
+    get_image_memory_budget,
+    get_memory_budget_config
+)
+from .services.upstream_probe import (
+    get_upstream_prober
+)
+from .services.precomputed_diagnosis import (
+    close_precomputed_table,
+    get_precomputed_table,
+    load_precomputed_table
+)
+from .services.profiler import (
+    CPU_MODE,
+    COLLAPSED_FORMAT,
+    PROFILE_MODE_PATTERN,
+    PROFILE_OUTPUT_PATTERN,
+    ProfilerBusyError,
+    get_process_profiler
+)
+from .services.speculative_image import (
+    get_speculative_image_generator
+)
+from .services.structured_logging import (
+    configure_logging,
+    get_logging_metrics,
+    stop_logging
 )
 
-# ロガーの設定
-logging.basicConfig(level=logging.INFO)
+# ロガーの設定（キュー経由でバックグラウンドスレッドから書き出す）
+configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="No Smoking ADK API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """サーバーの起動・終了時の処理"""
+    # 生成プロファイルの設定誤りは起動時に検出する
+    validate_generation_profiles()
+    # 事前計算した診断テーブルをメモリマップで読み込む
+    load_precomputed_table()
+    # モデルの疎通確認をバックグラウンドで開始
+    upstream_prober = get_upstream_prober()
+    upstream_prober.start()
+    yield
+    await get_speculative_image_generator().shutdown()
+    await upstream_prober.stop()
+    shutdown_image_encode_executor()
+    close_precomputed_table()
+    stop_logging()
+
+
+app = FastAPI(title="No Smoking ADK API", version="1.0.0", lifespan=lifespan)
 
 # CORS設定 - フロントエンドからのアクセスを許可
 app.add_middleware(
@@ -36,6 +116,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"],
 )
 
 @app.get("/")
@@ -69,6 +150,9 @@ class DiagnoseResponse(BaseModel):
     """診断APIのレスポンスモデル"""
     success: bool = Field(..., description="処理成功フラグ")
     data: SmokingAnalysisResponse = Field(..., description="診断結果データ")
+    served_tier: str = Field(..., description="応答したモデルティア（primary / lite / precomputed）")
+    served_model: str = Field(..., description="応答したモデル名")
+    reused: bool = Field(False, description="近傍の過去診断を再利用したか")
 
 
 class ErrorResponse(BaseModel):
@@ -82,12 +166,68 @@ class AnalyzeImageResponse(BaseModel):
     """画像分析APIのレスポンスモデル"""
     success: bool = Field(..., description="処理成功フラグ")
     analysis: str = Field(..., description="画像分析結果")
+    served_tier: str = Field(..., description="応答したモデルティア（primary / lite）")
+    served_model: str = Field(..., description="応答したモデル名")
 
 
 class GenerateImageResponse(BaseModel):
     """画像生成APIのレスポンスモデル"""
     success: bool = Field(..., description="処理成功フラグ")
     image_base64: str = Field(..., description="生成された画像のbase64データ")
+    image_mime_type: str = Field("image/png", description="生成された画像のMIMEタイプ")
+    width: Optional[int] = Field(None, description="生成された画像の幅")
+    height: Optional[int] = Field(None, description="生成された画像の高さ")
+    thumbnail_base64: Optional[str] = Field(None, description="サムネイル画像のbase64データ（要求時のみ）")
+    speculative: bool = Field(False, description="先行生成済みの画像を返したか")
+
+
+def get_client_ip(http_request: Request) -> Optional[str]:
+    """
+    クライアントIPを取得（プロキシ経由の場合は信頼できるプロキシが追記したX-Forwarded-Forの値を使用）
+    
+    Args:
+        http_request: HTTPリクエスト
+    
+    Returns:
+        クライアントIP
+    """
+    return resolve_client_ip(
+        http_request.headers.get("x-forwarded-for"),
+        http_request.client.host if http_request.client else None,
+        get_rate_limiter().config.trusted_proxy_hops
+    )
+
+
+async def enforce_rate_limit(
+    endpoint: str,
+    http_request: Request,
+    response: Response,
+    session_id: Optional[str] = None
+) -> None:
+    """
+    セッション・クライアントIPごとのレート制限を適用し、レート制限ヘッダーを設定
+    
+    Args:
+        endpoint: エンドポイント名
+        http_request: HTTPリクエスト
+        response: レスポンス（ヘッダー設定用）
+        session_id: セッションID
+    
+    Raises:
+        HTTPException: レート制限を超過した場合（429）
+    """
+    rate_limiter = get_rate_limiter()
+    if not rate_limiter.config.enabled:
+        return
+    
+    result = await rate_limiter.check(endpoint, get_client_ip(http_request), session_id)
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="リクエストが多すぎます。しばらく待ってから再度お試しください",
+            headers=result.to_headers()
+        )
+    response.headers.update(result.to_headers())
 
 
 # 画像分析サービスインスタンスを取得
@@ -104,12 +244,20 @@ def get_image_analysis_service() -> ImageAnalysisService:
 
 
 @app.post("/api/diagnose", response_model=DiagnoseResponse)
-async def diagnose(request: DiagnoseRequest) -> DiagnoseResponse:
+async def diagnose(
+    request: DiagnoseRequest,
+    http_request: Request,
+    response: Response,
+    x_request_deadline_ms: Optional[int] = Header(None, description="クライアント側の残りデッドライン（ミリ秒）")
+) -> DiagnoseResponse:
     """
     問診データに基づいて喫煙による健康・肌への影響を診断するエンドポイント
     
     Args:
         request: 診断リクエスト（セッションIDと問診データを含む）
+        http_request: HTTPリクエスト（レート制限用）
+        response: レスポンス（レート制限ヘッダー設定用）
+        x_request_deadline_ms: 残りデッドライン（モデルティア選択に使用）
     
     Returns:
         診断結果
@@ -118,7 +266,52 @@ async def diagnose(request: DiagnoseRequest) -> DiagnoseResponse:
         HTTPException: バリデーションエラー、サーバーエラー等
     """
     try:
-        logger.info(f"Received diagnosis request for session: {request.session_id}")
+        logger.info("Received diagnosis request for session: %s", request.session_id)
+        await enforce_rate_limit(DIAGNOSE_ENDPOINT, http_request, response, request.session_id)
+        
+        # 事前計算テーブルに該当バケットがあればモデルを呼び出さずに応答
+        precomputed_table = get_precomputed_table()
+        if precomputed_table is not None:
+            precomputed = precomputed_table.lookup(request.questionnaire)
+            if precomputed is not None:
+                precomputed_result, precomputed_model = precomputed
+                logger.info("Served precomputed diagnosis for session: %s", request.session_id)
+                get_speculative_image_generator().record_diagnosis(
+                    request.session_id,
+                    get_client_ip(http_request),
+                    request.questionnaire,
+                    precomputed_result.predicted_impact
+                )
+                return DiagnoseResponse(
+                    success=True,
+                    data=precomputed_result,
+                    served_tier="precomputed",
+                    served_model=precomputed_model
+                )
+        
+        # 近傍の過去診断が許容誤差内にあれば再利用（オプトイン）
+        diagnosis_reuse_index = get_diagnosis_reuse_index()
+        if diagnosis_reuse_index.config.enabled:
+            reused = diagnosis_reuse_index.lookup(request.questionnaire)
+            if reused is not None:
+                logger.info(
+                    "Reused nearby diagnosis for session: %s", request.session_id,
+                    extra={"deviations": reused.deviations}
+                )
+                get_speculative_image_generator().record_diagnosis(
+                    request.session_id,
+                    get_client_ip(http_request),
+                    request.questionnaire,
+                    reused.response.predicted_impact
+                )
+                return DiagnoseResponse(
+                    success=True,
+                    data=reused.response,
+                    served_tier=reused.served_tier,
+                    served_model=reused.served_model,
+                    reused=True
+                )
+        
         # VertexAIサービスを取得
         try:
             vertex_ai_service = get_vertex_ai_service()
@@ -131,21 +324,48 @@ async def diagnose(request: DiagnoseRequest) -> DiagnoseResponse:
         # 診断用プロンプトを作成
         prompt = create_diagnosis_prompt(request.questionnaire)
         
+        # 負荷・デッドラインに応じてモデルティアを選択
+        model_tier_policy = get_model_tier_policy()
+        tier_decision = model_tier_policy.select(remaining_deadline_ms=x_request_deadline_ms)
+        
         # VertexAI APIを呼び出してテキスト生成
-        response_text = await vertex_ai_service.generate_text(prompt)
+        async with model_tier_policy.track(tier_decision):
+            response_text = await vertex_ai_service.generate_text(
+                prompt,
+                model_name=tier_decision.model,
+                profile=get_profile_for_endpoint(DIAGNOSE_ENDPOINT)
+            )
         
         # レスポンスをパースして診断結果を作成
         analysis_result = parse_diagnosis_response(response_text)
         
-        logger.info(f"Diagnosis completed successfully for session: {request.session_id}")
+        if diagnosis_reuse_index.config.enabled:
+            diagnosis_reuse_index.add(
+                request.questionnaire,
+                analysis_result,
+                served_tier=tier_decision.tier,
+                served_model=tier_decision.model
+            )
+        
+        logger.info("Diagnosis completed successfully for session: %s", request.session_id)
+        
+        # 顔写真が揃っていれば「20年後の顔」画像の先行生成を開始
+        get_speculative_image_generator().record_diagnosis(
+            request.session_id,
+            get_client_ip(http_request),
+            request.questionnaire,
+            analysis_result.predicted_impact
+        )
         
         return DiagnoseResponse(
             success=True,
-            data=analysis_result
+            data=analysis_result,
+            served_tier=tier_decision.tier,
+            served_model=tier_decision.model
         )
         
     except ValidationError as e:
-        logger.error(f"Validation error for session {request.session_id}: {str(e)}")
+        logger.error("Validation error for session %s: %s", request.session_id, e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"リクエストデータが不正です: {str(e)}"
@@ -156,7 +376,7 @@ async def diagnose(request: DiagnoseRequest) -> DiagnoseResponse:
         raise
         
     except Exception as e:
-        logger.error(f"Unexpected error during diagnosis for session {request.session_id}: {str(e)}")
+        logger.error("Unexpected error during diagnosis for session %s: %s", request.session_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="診断処理中に予期しないエラーが発生しました"
@@ -164,12 +384,20 @@ async def diagnose(request: DiagnoseRequest) -> DiagnoseResponse:
 
 
 @app.post("/api/analyze-image", response_model=AnalyzeImageResponse)
-async def analyze_image(file: UploadFile = File(...)) -> AnalyzeImageResponse:
+async def analyze_image(
+    http_request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None, max_length=64, description="セッションID"),
+    x_request_deadline_ms: Optional[int] = Header(None, description="クライアント側の残りデッドライン（ミリ秒）")
+) -> AnalyzeImageResponse:
     """
     アップロードされた画像から喫煙による健康・肌への影響を分析するエンドポイント
     
     Args:
         file: アップロードされた画像ファイル
+        session_id: セッションID（レート制限用）
+        x_request_deadline_ms: 残りデッドライン（モデルティア選択に使用）
     
     Returns:
         画像分析結果
@@ -178,7 +406,8 @@ async def analyze_image(file: UploadFile = File(...)) -> AnalyzeImageResponse:
         HTTPException: ファイル形式エラー、分析エラー等
     """
     try:
-        logger.info(f"Received image analysis request: {file.filename}")
+        logger.info("Received image analysis request: %s", file.filename)
+        await enforce_rate_limit(ANALYZE_IMAGE_ENDPOINT, http_request, response, session_id)
         
         # ファイル形式の検証
         if not file.content_type or not file.content_type.startswith('image/'):
@@ -187,17 +416,59 @@ async def analyze_image(file: UploadFile = File(...)) -> AnalyzeImageResponse:
                 detail="画像ファイルをアップロードしてください"
             )
         
-        # 画像分析サービスを取得
-        image_analysis_service = get_image_analysis_service()
-        
-        # 画像分析を実行（UploadFileを直接渡す）
-        analysis_result = await image_analysis_service.analyze_image_from_upload(file)
+        # 画像をデコードする前にヘッダーでサイズを判定し、プロセス全体のメモリ予算を確保
+        ensure_image_dimensions(file.file, get_image_quality_config())
+        memory_budget_config = get_memory_budget_config()
+        estimated_bytes = estimate_image_request_bytes(file.file, decodes_full_image=True)
+        async with get_image_memory_budget().reserve(
+            estimated_bytes,
+            timeout=memory_budget_config.acquire_timeout_seconds
+        ):
+            # モデル呼び出し前にローカルで画像品質を判定（デコードはワーカースレッドで実行）
+            await ensure_upload_quality_async(file.file, get_image_quality_config())
+            
+            # 診断結果が揃っていれば「20年後の顔」画像の先行生成を開始
+            get_speculative_image_generator().record_photo(
+                session_id, get_client_ip(http_request), file.file, file.content_type
+            )
+            
+            # 画像分析サービスを取得
+            image_analysis_service = get_image_analysis_service()
+            
+            # 負荷・デッドラインに応じてモデルティアを選択
+            model_tier_policy = get_model_tier_policy()
+            tier_decision = model_tier_policy.select(remaining_deadline_ms=x_request_deadline_ms)
+            
+            # 画像分析を実行（UploadFileを直接渡す）
+            async with model_tier_policy.track(tier_decision):
+                analysis_result = await image_analysis_service.analyze_image_from_upload(
+                    file,
+                    model_name=tier_decision.model,
+                    profile=get_profile_for_endpoint(ANALYZE_IMAGE_ENDPOINT)
+                )
         
-        logger.info(f"Image analysis completed successfully for file: {file.filename}")
+        logger.info("Image analysis completed successfully for file: %s", file.filename)
         
         return AnalyzeImageResponse(
             success=True,
-            analysis=analysis_result
+            analysis=analysis_result,
+            served_tier=tier_decision.tier,
+            served_model=tier_decision.model
+        )
+        
+    except ImageQualityError as e:
+        logger.info("Image rejected by quality gate for file %s: %s", file.filename, e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+        
+    except MemoryBudgetTimeoutError as e:
+        logger.warning("Image analysis rejected by memory budget for file %s: %s", file.filename, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="サーバーが混雑しています。しばらく待ってから再度お試しください",
+            headers={"Retry-After": "5"}
         )
         
     except HTTPException:
@@ -205,7 +476,7 @@ async def analyze_image(file: UploadFile = File(...)) -> AnalyzeImageResponse:
         raise
         
     except Exception as e:
-        logger.error(f"Unexpected error during image analysis for file {file.filename}: {str(e)}")
+        logger.error("Unexpected error during image analysis for file %s: %s", file.filename, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="画像分析処理中に予期しないエラーが発生しました"
@@ -214,8 +485,15 @@ async def analyze_image(file: UploadFile = File(...)) -> AnalyzeImageResponse:
 
 @app.post("/api/generate-image", response_model=GenerateImageResponse)
 async def generate_image(
+    http_request: Request,
+    response: Response,
     prompt: str = Form(..., description="画像生成用のプロンプトテキスト"),
-    file: UploadFile = File(..., description="参考画像（必須）")
+    file: UploadFile = File(..., description="参考画像（必須）"),
+    session_id: Optional[str] = Form(None, max_length=64, description="セッションID"),
+    output_format: str = Form("png", pattern=OUTPUT_FORMAT_PATTERN, description="出力形式（png / webp / jpeg / avif）"),
+    quality: int = Form(85, ge=1, le=100, description="画質（PNG以外）"),
+    max_dimension: Optional[int] = Form(None, ge=64, le=4096, description="長辺の最大ピクセル数"),
+    thumbnail_size: Optional[int] = Form(None, ge=32, le=512, description="サムネイルの長辺ピクセル数")
 ) -> GenerateImageResponse:
     """
     プロンプトテキストと参考画像から画像を生成するエンドポイント
@@ -223,6 +501,11 @@ async def generate_image(
     Args:
         prompt: 画像生成用のプロンプトテキスト（必須）
         image: 参考画像ファイル（必須）
+        session_id: セッションID（レート制限用）
+        output_format: 出力形式（png / webp / jpeg / avif）
+        quality: 画質（PNG以外）
+        max_dimension: 長辺の最大ピクセル数（省略時は生成サイズのまま）
+        thumbnail_size: サムネイルの長辺ピクセル数（省略時はサムネイルなし）
     
     Returns:
         生成された画像のbase64データ
@@ -231,7 +514,16 @@ async def generate_image(
         HTTPException: バリデーションエラー、生成エラー等
     """
     try:
-        logger.info(f"画像生成リクエストを受信: プロンプト='{prompt}', 画像ファイル={file.filename if file else 'なし'}")
+        # プロンプトはログ設定に従って伏せ字・切り詰めされる
+        logger.info(
+            "画像生成リクエストを受信: 画像ファイル=%s", file.filename if file else 'なし',
+            extra={"prompt": prompt, "session_id": session_id}
+        )
+        # 先行生成の開始時にコストを計上済みの場合は、その結果を引き取れなかったときだけ計上する
+        speculative_image_generator = get_speculative_image_generator()
+        charged_by_speculation = speculative_image_generator.is_charged(session_id)
+        if not charged_by_speculation:
+            await enforce_rate_limit(GENERATE_IMAGE_ENDPOINT, http_request, response, session_id)
 
         # ファイル形式の検証
         if not file.content_type or not file.content_type.startswith('image/'):
@@ -246,21 +538,93 @@ async def generate_image(
                 detail="プロンプトテキストは必須です"
             )
         
-        # 画像生成の実行
-        try:
-            generated_image_base64 = generate_image_from_prompt(prompt.strip(), file)
-        except Exception as e:
-            logger.error(f"画像生成中にエラーが発生: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"画像生成に失敗しました: {str(e)}"
+        # 画像を読み込む前にヘッダーでサイズを判定し、プロセス全体のメモリ予算を確保
+        # （品質判定はJPEG以外をフル解像度でデコードする）
+        image_quality_config = get_image_quality_config()
+        ensure_image_dimensions(file.file, image_quality_config)
+        memory_budget_config = get_memory_budget_config()
+        estimated_bytes = estimate_image_request_bytes(
+            file.file,
+            decodes_full_image=image_quality_config.enabled,
+            output_allowance_bytes=memory_budget_config.generated_image_allowance_bytes,
+            decodes_jpeg_draft=True
+        )
+        async with get_image_memory_budget().reserve(
+            estimated_bytes,
+            timeout=memory_budget_config.acquire_timeout_seconds
+        ):
+            # モデル呼び出し前にローカルで画像品質を判定（デコードはワーカースレッドで実行）
+            await ensure_upload_quality_async(file.file, image_quality_config)
+            
+            # 画像生成の実行（アップロード画像はデコードせずバイト列のまま渡す）
+            image_data = await file.read()
+            
+            # 同じプロンプト・画像の先行生成があれば、その結果を使う（実行中なら完了を待つ）
+            speculative_result = await speculative_image_generator.claim(
+                session_id,
+                prompt.strip(),
+                image_data,
+                file.content_type
             )
+            if speculative_result is None and charged_by_speculation:
+                await enforce_rate_limit(GENERATE_IMAGE_ENDPOINT, http_request, response, session_id)
+            
+            try:
+                served_speculatively = speculative_result is not None
+                if served_speculatively:
+                    generated_image, generated_mime_type = speculative_result
+                else:
+                    generated_image, generated_mime_type = await generate_image_bytes_from_prompt(
+                        prompt.strip(),
+                        image_data,
+                        file.content_type
+                    )
+                del image_data, speculative_result
+                
+                # 要求された形式・サイズへの変換はワーカースレッドで実行
+                encoded_image = await encode_generated_image_async(
+                    generated_image,
+                    generated_mime_type,
+                    ImageOutputOptions(
+                        output_format=output_format,
+                        quality=quality,
+                        max_dimension=max_dimension,
+                        thumbnail_size=thumbnail_size
+                    )
+                )
+                del generated_image
+            except Exception as e:
+                logger.error("画像生成中にエラーが発生: %s", e)
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"画像生成に失敗しました: {str(e)}"
+                )
         
         logger.info("画像生成が正常に完了しました")
         
         return GenerateImageResponse(
             success=True,
-            image_base64=generated_image_base64
+            image_base64=encoded_image.image_base64,
+            image_mime_type=encoded_image.mime_type,
+            width=encoded_image.width,
+            height=encoded_image.height,
+            thumbnail_base64=encoded_image.thumbnail_base64,
+            speculative=served_speculatively
+        )
+        
+    except ImageQualityError as e:
+        logger.info("画像品質判定で不合格: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+        
+    except MemoryBudgetTimeoutError as e:
+        logger.warning("メモリ予算を確保できず画像生成を拒否: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="サーバーが混雑しています。しばらく待ってから再度お試しください",
+            headers={"Retry-After": "5"}
         )
         
     except HTTPException:
@@ -268,7 +632,7 @@ async def generate_image(
         raise
         
     except Exception as e:
-        logger.error(f"画像生成処理中に予期しないエラーが発生: {str(e)}")
+        logger.error("画像生成処理中に予期しないエラーが発生: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="画像生成処理中に予期しないエラーが発生しました"
@@ -284,6 +648,8 @@ async def health_check() -> Dict[str, Any]:
         サービス状態情報
     """
     try:
+        precomputed_table = get_precomputed_table()
+        
         # VertexAIサービスのヘルスチェック
         try:
             vertex_ai_service = get_vertex_ai_service()
@@ -298,12 +664,94 @@ async def health_check() -> Dict[str, Any]:
             "status": "healthy",
             "api_version": "1.0.0",
             "vertex_ai": vertex_ai_status,
+            "model_tier": get_model_tier_policy().snapshot(),
+            "diagnosis_reuse": get_diagnosis_reuse_index().metrics(),
+            "precomputed_diagnoses": precomputed_table.metrics() if precomputed_table else None,
+            "image_memory_budget": get_image_memory_budget().snapshot(),
+            "upstream": get_upstream_prober().snapshot(),
+            "speculative_image": get_speculative_image_generator().snapshot(),
+            "logging": get_logging_metrics(),
             "message": "All services are running normally"
         }
         
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"サービスが利用できません: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@app.get("/api/health/live")
+async def liveness() -> Dict[str, Any]:
+    """
+    Liveness Probe用エンドポイント（プロセスが応答できることのみを返す）
+    
+    Returns:
+        サービス状態情報
+    """
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready")
+async def readiness() -> JSONResponse:
+    """
+    Readiness Probe用エンドポイント
+    
+    バックグラウンドの疎通確認で記録した状態のみを参照し、上流への呼び出しは行わない
+    
+    Returns:
+        受付可能な場合は200、全モデルのサーキットが開いている場合は503
+    """
+    upstream_prober = get_upstream_prober()
+    ready = upstream_prober.is_ready()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if ready else "unavailable",
+            "upstream": upstream_prober.snapshot()
+        }
+    )
+
+
+@app.get("/api/admin/profile")
+async def profile_process(
+    mode: str = Query(CPU_MODE, pattern=PROFILE_MODE_PATTERN, description="cpu（スタックサンプリング）または memory（tracemalloc）"),
+    output_format: str = Query(COLLAPSED_FORMAT, pattern=PROFILE_OUTPUT_PATTERN, description="collapsed または speedscope"),
+    duration_seconds: float = Query(5.0, gt=0, le=60, description="採取する秒数"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="スタックの採取間隔（ミリ秒）"),
+    x_admin_token: Optional[str] = Header(None, description="管理者トークン")
+) -> Response:
+    """
+    稼働中のプロセスのプロファイルを一定時間採取する管理者用エンドポイント
+    
+    PROFILER_ADMIN_TOKEN が未設定の場合は無効（404）
+    
+    Args:
+        mode: cpu（全スレッドのスタックサンプリング）または memory（tracemallocの確保メモリ）
+        output_format: collapsed（flamegraph.pl 等）または speedscope（JSON）
+        duration_seconds: 採取する秒数（設定の最大値に切り詰める）
+        interval_ms: cpuモードの採取間隔（ミリ秒）
+        x_admin_token: 管理者トークン
+    
+    Returns:
+        collapsed-stack 形式のテキスト、または speedscope 形式のJSON
+    """
+    profiler = get_process_profiler()
+    if not profiler.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not profiler.is_authorized(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者トークンが正しくありません")
+    
+    try:
+        logger.warning("Profiling started: mode=%s, duration=%ss", mode, duration_seconds)
+        profile = await profiler.run(mode, duration_seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    
+    if output_format == COLLAPSED_FORMAT:
+        return PlainTextResponse(profile.to_collapsed())
+    return JSONResponse(
+        content=profile.to_speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="{mode}.speedscope.json"'}
+    )
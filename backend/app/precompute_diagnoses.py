@@ -0,0 +1,134 @@
+"""
+よく出現する問診バケットの診断結果を事前計算し、メモリマップ用のテーブルファイルに書き出すオフラインジョブ
+
+入力は問診データ（SmokingAnalysisRequestのJSON）を1行ずつ並べたJSONLファイル。
+出現数の多いバケットから順に、バケット内の最初の問診データを代表として診断を生成する。
+
+使用例:
+    python -m app.precompute_diagnoses --samples questionnaires.jsonl --top 500 --concurrency 4 \
+        --output precomputed_diagnoses.bin
+"""
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from pydantic import ValidationError
+
+from .services.vertex_ai import VertexAIService, get_vertex_ai_service
+from .services.diagnose_from_text import (
+    SmokingAnalysisRequest,
+    create_diagnosis_prompt,
+    parse_diagnosis_response
+)
+from .services.diagnosis_reuse import is_reusable_request
+from .services.generation_profile import DIAGNOSE_ENDPOINT, get_profile_for_endpoint
+from .services.precomputed_diagnosis import questionnaire_bucket_key, write_precomputed_table
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def select_common_buckets(samples_path: str, top: int) -> List[Tuple[int, SmokingAnalysisRequest, int]]:
+    """
+    サンプルの問診データをバケットごとに集計し、出現数の多い順に代表データを返す
+
+    Args:
+        samples_path: 問診データのJSONLファイルパス
+        top: 取得するバケット数
+
+    Returns:
+        バケットキー・代表の問診データ・出現数のリスト
+    """
+    counts: Counter = Counter()
+    representatives: Dict[int, SmokingAnalysisRequest] = {}
+    with open(samples_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                questionnaire = SmokingAnalysisRequest(**json.loads(line))
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.warning("Skipping invalid sample at line %s: %s", line_number, e)
+                continue
+            # 自由記述ありの問診はテーブルから引かれないため集計しない
+            if not is_reusable_request(questionnaire):
+                continue
+            key = questionnaire_bucket_key(questionnaire)
+            counts[key] += 1
+            representatives.setdefault(key, questionnaire)
+
+    return [(key, representatives[key], count) for key, count in counts.most_common(top)]
+
+
+async def generate_bucket_diagnosis(
+    vertex_ai_service: VertexAIService,
+    questionnaire: SmokingAnalysisRequest,
+    semaphore: asyncio.Semaphore,
+    model_name: Optional[str]
+) -> Optional[bytes]:
+    """
+    1バケット分の診断を生成し、テーブルに格納するJSONに変換
+
+    Args:
+        vertex_ai_service: VertexAIサービスインスタンス
+        questionnaire: バケットの代表の問診データ
+        semaphore: 同時実行数を制限するセマフォ
+        model_name: 使用するモデル名（省略時はデフォルト）
+
+    Returns:
+        診断結果JSON（UTF-8）。生成に失敗した場合はNone
+    """
+    async with semaphore:
+        try:
+            response_text = await vertex_ai_service.generate_text(
+                create_diagnosis_prompt(questionnaire),
+                model_name=model_name,
+                profile=get_profile_for_endpoint(DIAGNOSE_ENDPOINT)
+            )
+            result = parse_diagnosis_response(response_text)
+        except Exception as e:
+            logger.error("Diagnosis generation failed for bucket: %s", e)
+            return None
+
+    payload = {
+        "impact_on_appearance": result.impact_on_appearance,
+        "predicted_impact": result.predicted_impact,
+        "model": model_name or vertex_ai_service.model_name,
+    }
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="よく出現する問診バケットの診断結果を事前計算")
+    parser.add_argument("--samples", required=True, help="問診データのJSONLファイルパス")
+    parser.add_argument("--output", required=True, help="出力するテーブルファイルパス")
+    parser.add_argument("--top", type=int, default=500, help="事前計算するバケット数")
+    parser.add_argument("--concurrency", type=int, default=4, help="モデル呼び出しの同時実行数")
+    parser.add_argument("--model", default=None, help="使用するモデル名")
+    args = parser.parse_args()
+
+    buckets = select_common_buckets(args.samples, args.top)
+    logger.info("Precomputing %s buckets with concurrency=%s", len(buckets), args.concurrency)
+
+    vertex_ai_service = get_vertex_ai_service()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    payloads = await asyncio.gather(*[
+        generate_bucket_diagnosis(vertex_ai_service, questionnaire, semaphore, args.model)
+        for _, questionnaire, _ in buckets
+    ])
+
+    entries = {
+        key: payload
+        for (key, _, _), payload in zip(buckets, payloads)
+        if payload is not None
+    }
+    write_precomputed_table(args.output, entries)
+
+    covered = sum(count for (key, _, count) in buckets if key in entries)
+    logger.info("Wrote %s/%s buckets to %s (covering %s samples)", len(entries), len(buckets), args.output, covered)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,9 +2,11 @@
 画像から喫煙による健康・肌への影響を分析するサービス
 """
 import logging
+from typing import Optional
 from PIL import Image
 from fastapi import UploadFile
 from .vertex_ai import VertexAIService
+from .generation_profile import GenerationProfile
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -25,7 +27,9 @@ class ImageAnalysisService:
     async def analyze_image_from_upload(
         self,
         file: UploadFile,
-        analysis_type: str = "smoking_effects"
+        analysis_type: str = "smoking_effects",
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
     ) -> str:
         """
         UploadFileから直接画像を分析して喫煙による影響を診断
@@ -33,6 +37,8 @@ class ImageAnalysisService:
         Args:
             file: アップロードされた画像ファイル
             analysis_type: 分析タイプ（現在は'smoking_effects'のみ）
+            model_name: 使用するモデル名（省略時はVertexAIサービスのデフォルト）
+            profile: 生成プロファイル（省略時はモデルのデフォルト設定）
             
         Returns:
             分析結果の文字列
@@ -41,7 +47,7 @@ class ImageAnalysisService:
             Exception: 画像分析エラー
         """
         try:
-            logger.info(f"Starting image analysis with type: {analysis_type}")
+            logger.info("Starting image analysis with type: %s", analysis_type)
             
             # 画像を検証（ファイルサイズとPIL読み込み可能性）
             pil_image = self._validate_and_load_image_from_upload(file)
@@ -50,14 +56,16 @@ class ImageAnalysisService:
             # VertexAIサービスの画像分析機能を使用
             analysis_result = await self.vertex_ai_service.analyze_image_with_pil(
                 pil_image=pil_image,
-                prompt=prompt
+                prompt=prompt,
+                model_name=model_name,
+                profile=profile
             )
                 
             logger.info("Image analysis completed successfully")
             return analysis_result
             
         except Exception as e:
-            logger.error(f"Image analysis failed: {str(e)}")
+            logger.error("Image analysis failed: %s", e)
             raise Exception(f"画像分析に失敗しました: {str(e)}")
 
   
@@ -99,7 +107,7 @@ class ImageAnalysisService:
             if image.format not in ['JPEG', 'PNG', 'WebP']:
                 raise Exception(f"サポートされていない画像形式です: {image.format}")
                 
-            logger.info(f"Image validation passed: {image.format}, {image.size}")
+            logger.info("Image validation passed: %s, %s", image.format, image.size)
             
             # ファイルポインタを先頭に戻す
             file.file.seek(0)
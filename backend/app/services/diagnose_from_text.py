@@ -142,12 +142,12 @@ def parse_diagnosis_response(response_text: str) -> SmokingAnalysisResponse:
         return result
         
     except json.JSONDecodeError as e:
-        logger.error(f"JSON parse error: {str(e)}")
+        logger.error("JSON parse error: %s", e)
         raise Exception(f"レスポンスの解析に失敗しました: {str(e)}")
     except KeyError as e:
-        logger.error(f"Missing required field: {str(e)}")
+        logger.error("Missing required field: %s", e)
         raise Exception(f"必要なフィールドが不足しています: {str(e)}")
     except Exception as e:
-        logger.error(f"Response parsing error: {str(e)}")
+        logger.error("Response parsing error: %s", e)
         raise Exception(f"レスポンス処理中にエラーが発生しました: {str(e)}")
 
@@ -0,0 +1,266 @@
+"""
+問診データを数値特徴ベクトルに変換し、近傍の過去診断結果を再利用するモジュール（オプトイン）
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, Field
+
+from .diagnose_from_text import (
+    CigaretteType,
+    Gender,
+    SmokingAnalysisRequest,
+    SmokingAnalysisResponse
+)
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 特徴ベクトルの各次元
+FEATURE_NAMES: List[str] = [
+    "age",
+    "smoking_years",
+    "pack_years",
+    "gender",
+    "cigarette_type",
+    "exercise_frequency",
+    "alcohol_consumption",
+    "sleep_hours",
+]
+
+# 特徴ごとの許容誤差のデフォルト（カテゴリ値は完全一致のみ）
+DEFAULT_TOLERANCES: Dict[str, float] = {
+    "age": 2.0,
+    "smoking_years": 2.0,
+    "pack_years": 1.5,
+    "gender": 0.0,
+    "cigarette_type": 0.0,
+    "exercise_frequency": 1.0,
+    "alcohol_consumption": 1.0,
+    "sleep_hours": 1.0,
+}
+
+_GENDER_CODES = {gender: float(index) for index, gender in enumerate(Gender)}
+_CIGARETTE_TYPE_CODES = {cigarette_type: float(index) for index, cigarette_type in enumerate(CigaretteType)}
+
+
+class DiagnosisReuseConfig(BaseModel):
+    """近傍診断再利用の設定"""
+    enabled: bool = Field(False, description="近傍診断の再利用を行うか（オプトイン）")
+    max_entries: int = Field(5000, ge=1, description="インデックスに保持する最大件数（超過時は古いものから上書き）")
+    tolerances: Dict[str, float] = Field(
+        default_factory=lambda: dict(DEFAULT_TOLERANCES),
+        description="特徴ごとの許容誤差"
+    )
+
+    @classmethod
+    def from_env(cls) -> "DiagnosisReuseConfig":
+        """
+        環境変数から設定を読み込む
+
+        DIAGNOSIS_REUSE_TOLERANCES にJSONで特徴ごとの許容誤差を指定できる（例: {"age": 1}）
+
+        Returns:
+            DiagnosisReuseConfigインスタンス
+        """
+        defaults = cls()
+        tolerances = dict(DEFAULT_TOLERANCES)
+        tolerances_text = os.getenv("DIAGNOSIS_REUSE_TOLERANCES")
+        if tolerances_text:
+            overrides = json.loads(tolerances_text)
+            unknown = set(overrides) - set(FEATURE_NAMES)
+            if unknown:
+                raise ValueError(f"不明な特徴名です: {', '.join(sorted(unknown))}")
+            tolerances.update({name: float(value) for name, value in overrides.items()})
+
+        return cls(
+            enabled=os.getenv("DIAGNOSIS_REUSE_ENABLED", "false").lower() == "true",
+            max_entries=int(os.getenv("DIAGNOSIS_REUSE_MAX_ENTRIES", defaults.max_entries)),
+            tolerances=tolerances,
+        )
+
+
+class ReusedDiagnosis(BaseModel):
+    """再利用された診断結果"""
+    response: SmokingAnalysisResponse = Field(..., description="過去の診断結果")
+    served_tier: str = Field(..., description="元の診断を生成したモデルティア")
+    served_model: str = Field(..., description="元の診断を生成したモデル名")
+    deviations: Dict[str, float] = Field(..., description="特徴ごとの問い合わせとの差")
+
+
+def is_reusable_request(data: SmokingAnalysisRequest) -> bool:
+    """
+    再利用の対象にできる問診データか判定
+
+    自由記述の項目（ブランド、健康問題、医師の助言）は特徴ベクトルで表現できないため、
+    これらが入力されている場合は再利用の対象外とする
+
+    Args:
+        data: 問診データ
+
+    Returns:
+        対象にできる場合True
+    """
+    return not (data.cigarette_brand or data.current_health_issues or data.previous_medical_advice)
+
+
+def questionnaire_to_features(data: SmokingAnalysisRequest) -> np.ndarray:
+    """
+    問診データを特徴ベクトルに変換
+
+    Args:
+        data: 問診データ
+
+    Returns:
+        FEATURE_NAMESの順に並んだ特徴ベクトル
+    """
+    smoking_years = max(0, data.current_age - data.smoking_start_age)
+    pack_years = data.daily_cigarettes / 20.0 * smoking_years
+    return np.array([
+        data.current_age,
+        smoking_years,
+        pack_years,
+        _GENDER_CODES[data.gender],
+        _CIGARETTE_TYPE_CODES[data.cigarette_type],
+        data.exercise_frequency,
+        data.alcohol_consumption,
+        data.sleep_hours,
+    ], dtype=np.float32)
+
+
+class DiagnosisReuseIndex:
+    """NumPy配列で過去の診断結果を保持し、許容誤差内の近傍を検索するインデックス"""
+
+    def __init__(self, config: DiagnosisReuseConfig):
+        """
+        インデックスを初期化
+
+        Args:
+            config: 再利用の設定
+        """
+        self.config = config
+        self._tolerances = np.array(
+            [config.tolerances[name] for name in FEATURE_NAMES], dtype=np.float32
+        )
+        # 許容誤差0の特徴で0除算しないよう、距離の正規化には下限を設ける
+        self._scales = np.maximum(self._tolerances, 1e-3)
+        self._features = np.zeros((config.max_entries, len(FEATURE_NAMES)), dtype=np.float32)
+        # 追加された順に伸び、容量に達した後は古いものから上書きする（_featuresと同じ添字）
+        self._entries: List[Tuple[SmokingAnalysisResponse, str, str]] = []
+        self._size = 0
+        self._next_slot = 0
+
+        # メトリクス
+        self._lookups = 0
+        self._hits = 0
+        self._deviation_sum = np.zeros(len(FEATURE_NAMES), dtype=np.float64)
+        self._deviation_max = np.zeros(len(FEATURE_NAMES), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def lookup(self, data: SmokingAnalysisRequest) -> Optional[ReusedDiagnosis]:
+        """
+        許容誤差内で最も近い過去の診断結果を検索
+
+        Args:
+            data: 問診データ
+
+        Returns:
+            見つかった場合はReusedDiagnosis、見つからない場合はNone
+        """
+        if not is_reusable_request(data):
+            return None
+
+        self._lookups += 1
+        if self._size == 0:
+            return None
+
+        query = questionnaire_to_features(data)
+        deviations = np.abs(self._features[:self._size] - query)
+        within_tolerance = np.all(deviations <= self._tolerances, axis=1)
+        if not within_tolerance.any():
+            return None
+
+        candidate_indices = np.flatnonzero(within_tolerance)
+        distances = (deviations[candidate_indices] / self._scales).max(axis=1)
+        best_index = int(candidate_indices[int(distances.argmin())])
+        best_deviations = deviations[best_index]
+
+        self._hits += 1
+        self._deviation_sum += best_deviations
+        np.maximum(self._deviation_max, best_deviations, out=self._deviation_max)
+
+        response, served_tier, served_model = self._entries[best_index]
+        return ReusedDiagnosis(
+            response=response,
+            served_tier=served_tier,
+            served_model=served_model,
+            deviations={name: float(value) for name, value in zip(FEATURE_NAMES, best_deviations)}
+        )
+
+    def add(
+        self,
+        data: SmokingAnalysisRequest,
+        response: SmokingAnalysisResponse,
+        served_tier: str,
+        served_model: str
+    ) -> None:
+        """
+        診断結果をインデックスに追加（容量を超えた場合は最も古いものを上書き）
+
+        Args:
+            data: 問診データ
+            response: 診断結果
+            served_tier: 診断を生成したモデルティア
+            served_model: 診断を生成したモデル名
+        """
+        if not is_reusable_request(data):
+            return
+
+        slot = self._next_slot
+        self._features[slot] = questionnaire_to_features(data)
+        entry = (response, served_tier, served_model)
+        if slot == len(self._entries):
+            self._entries.append(entry)
+        else:
+            self._entries[slot] = entry
+        self._next_slot = (slot + 1) % self.config.max_entries
+        self._size = min(self._size + 1, self.config.max_entries)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        ヒット率と誤差に関するメトリクスを取得
+
+        Returns:
+            メトリクス情報（許容誤差が誤差の上限、観測された平均・最大の差が実際の誤差）
+        """
+        mean_deviation = self._deviation_sum / self._hits if self._hits else self._deviation_sum
+        return {
+            "enabled": self.config.enabled,
+            "entries": self._size,
+            "lookups": self._lookups,
+            "hits": self._hits,
+            "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+            "tolerances": dict(self.config.tolerances),
+            "mean_deviation": {name: float(value) for name, value in zip(FEATURE_NAMES, mean_deviation)},
+            "max_deviation": {name: float(value) for name, value in zip(FEATURE_NAMES, self._deviation_max)},
+        }
+
+
+_diagnosis_reuse_index: Optional[DiagnosisReuseIndex] = None
+
+
+def get_diagnosis_reuse_index() -> DiagnosisReuseIndex:
+    """
+    プロセス共有の近傍診断インデックスを取得
+
+    Returns:
+        DiagnosisReuseIndexインスタンス
+    """
+    global _diagnosis_reuse_index
+    if _diagnosis_reuse_index is None:
+        _diagnosis_reuse_index = DiagnosisReuseIndex(DiagnosisReuseConfig.from_env())
+    return _diagnosis_reuse_index
@@ -0,0 +1,165 @@
+"""
+エンドポイントごとの生成プロファイル（思考トークン予算・出力トークン上限など）を管理するモジュール
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+from google.genai import types
+from pydantic import BaseModel, Field, ValidationError
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+DIAGNOSE_ENDPOINT = "diagnose"
+ANALYZE_IMAGE_ENDPOINT = "analyze_image"
+GENERATE_IMAGE_ENDPOINT = "generate_image"
+
+
+class GenerationProfile(BaseModel):
+    """モデル呼び出し時の生成設定プロファイル"""
+    name: str = Field(..., description="プロファイル名")
+    thinking_budget: Optional[int] = Field(None, ge=0, description="思考トークン予算（Noneはモデルのデフォルト）")
+    max_output_tokens: Optional[int] = Field(None, ge=1, description="出力トークン上限（Noneは上限なし）")
+    temperature: Optional[float] = Field(None, ge=0, le=2, description="サンプリング温度")
+    stop_sequences: Optional[List[str]] = Field(None, description="生成を停止する文字列")
+    response_mime_type: Optional[str] = Field(None, description="レスポンスのMIMEタイプ")
+
+    def to_generate_content_config(self) -> types.GenerateContentConfig:
+        """
+        Google Gen AI SDKの生成設定に変換
+
+        Returns:
+            GenerateContentConfig
+        """
+        thinking_config = None
+        if self.thinking_budget is not None:
+            thinking_config = types.ThinkingConfig(thinking_budget=self.thinking_budget)
+
+        return types.GenerateContentConfig(
+            thinking_config=thinking_config,
+            max_output_tokens=self.max_output_tokens,
+            temperature=self.temperature,
+            stop_sequences=self.stop_sequences,
+            response_mime_type=self.response_mime_type,
+        )
+
+
+# 組み込みプロファイル
+# プロンプトは200〜250文字程度の出力を求めているため、思考は行わず出力トークンも小さく抑える
+BUILTIN_PROFILES: Dict[str, GenerationProfile] = {
+    "default": GenerationProfile(name="default"),
+    "concise_json": GenerationProfile(
+        name="concise_json",
+        thinking_budget=0,
+        max_output_tokens=768,
+        temperature=0.4,
+        response_mime_type="application/json",
+    ),
+    "concise_text": GenerationProfile(
+        name="concise_text",
+        thinking_budget=0,
+        max_output_tokens=512,
+        temperature=0.4,
+        response_mime_type="text/plain",
+    ),
+}
+
+# エンドポイントとプロファイル名の対応
+DEFAULT_ENDPOINT_PROFILES: Dict[str, str] = {
+    DIAGNOSE_ENDPOINT: "concise_json",
+    ANALYZE_IMAGE_ENDPOINT: "concise_text",
+}
+
+
+def load_profiles() -> Dict[str, GenerationProfile]:
+    """
+    組み込みプロファイルに環境変数 GENERATION_PROFILE_OVERRIDES（JSON）の上書きを適用して読み込む
+
+    例: {"concise_json": {"max_output_tokens": 512}, "my_profile": {"thinking_budget": 128}}
+
+    Returns:
+        プロファイル名とプロファイルの辞書
+
+    Raises:
+        ValueError: 上書き設定が不正な場合
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    overrides_text = os.getenv("GENERATION_PROFILE_OVERRIDES")
+    if not overrides_text:
+        return profiles
+
+    try:
+        overrides = json.loads(overrides_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"GENERATION_PROFILE_OVERRIDESのJSONが不正です: {str(e)}")
+
+    if not isinstance(overrides, dict):
+        raise ValueError("GENERATION_PROFILE_OVERRIDESはプロファイル名をキーとするJSONオブジェクトである必要があります")
+
+    for name, fields in overrides.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"GENERATION_PROFILE_OVERRIDESのプロファイル設定が不正です: {name}")
+        base = profiles.get(name, GenerationProfile(name=name))
+        try:
+            profiles[name] = GenerationProfile(**{**base.model_dump(), **fields, "name": name})
+        except ValidationError as e:
+            # リクエストの検証エラーと区別するため、設定エラーとして送出する
+            raise ValueError(f"GENERATION_PROFILE_OVERRIDESのプロファイル {name} が不正です: {str(e)}")
+        logger.info("Generation profile overridden: %s", name)
+
+    return profiles
+
+
+def get_profile_for_endpoint(endpoint: str) -> GenerationProfile:
+    """
+    エンドポイントに割り当てられた生成プロファイルを取得
+
+    割り当ては環境変数 GENERATION_PROFILE_<ENDPOINT>（例: GENERATION_PROFILE_DIAGNOSE）で変更できる
+
+    Args:
+        endpoint: エンドポイント名（diagnose / analyze_image）
+
+    Returns:
+        GenerationProfile
+
+    Raises:
+        ValueError: 存在しないプロファイル名が指定された場合
+    """
+    profiles = get_generation_profiles()
+    profile_name = os.getenv(
+        f"GENERATION_PROFILE_{endpoint.upper()}",
+        DEFAULT_ENDPOINT_PROFILES.get(endpoint, "default")
+    )
+    if profile_name not in profiles:
+        raise ValueError(f"生成プロファイルが見つかりません: {profile_name}")
+    return profiles[profile_name]
+
+
+_generation_profiles: Optional[Dict[str, GenerationProfile]] = None
+
+
+def get_generation_profiles() -> Dict[str, GenerationProfile]:
+    """
+    プロセス共有の生成プロファイル一覧を取得
+
+    Returns:
+        プロファイル名とプロファイルの辞書
+    """
+    global _generation_profiles
+    if _generation_profiles is None:
+        _generation_profiles = load_profiles()
+    return _generation_profiles
+
+
+def validate_generation_profiles() -> None:
+    """
+    プロファイルの上書き設定と各エンドポイントの割り当てを検証（サーバー起動時に呼び出す）
+
+    設定の誤りをリクエスト処理中ではなく起動時のエラーにする
+
+    Raises:
+        ValueError: 上書き設定が不正、または存在しないプロファイル名が割り当てられている場合
+    """
+    for endpoint in DEFAULT_ENDPOINT_PROFILES:
+        get_profile_for_endpoint(endpoint)
@@ -0,0 +1,182 @@
+"""
+生成画像を要求された形式（PNG / WebP / JPEG / AVIF）・サイズに変換し、サムネイルを作成するモジュール
+
+エンコードはCPU負荷が高いため、イベントループではなくワーカースレッドプールで実行する
+"""
+import asyncio
+import base64
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from PIL import Image, features
+from pydantic import BaseModel, Field
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 出力形式 -> (PILの形式名, MIMEタイプ)
+OUTPUT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "avif": ("AVIF", "image/avif"),
+}
+OUTPUT_FORMAT_PATTERN = "^(png|webp|jpeg|avif)$"
+
+# AVIFをエンコードできない環境での代替形式
+AVIF_FALLBACK_FORMAT = "webp"
+
+
+class ImageOutputOptions(BaseModel):
+    """クライアントが要求する出力画像の設定"""
+    output_format: str = Field("png", pattern=OUTPUT_FORMAT_PATTERN, description="出力形式")
+    quality: int = Field(85, ge=1, le=100, description="画質（PNG以外）")
+    max_dimension: Optional[int] = Field(None, ge=64, le=4096, description="長辺の最大ピクセル数")
+    thumbnail_size: Optional[int] = Field(None, ge=32, le=512, description="サムネイルの長辺ピクセル数")
+
+
+class EncodedImage(BaseModel):
+    """エンコード済みの画像"""
+    image_base64: str = Field(..., description="画像のbase64データ")
+    mime_type: str = Field(..., description="画像のMIMEタイプ")
+    width: int = Field(..., description="画像の幅")
+    height: int = Field(..., description="画像の高さ")
+    thumbnail_base64: Optional[str] = Field(None, description="サムネイルのbase64データ")
+
+
+def resolve_output_format(output_format: str) -> str:
+    """
+    この環境でエンコード可能な出力形式に解決（AVIF非対応の場合はWebPにする）
+
+    Args:
+        output_format: 要求された出力形式
+
+    Returns:
+        実際に使用する出力形式
+    """
+    if output_format == "avif" and not features.check("avif"):
+        logger.warning("AVIF encoding is not available, falling back to %s", AVIF_FALLBACK_FORMAT)
+        return AVIF_FALLBACK_FORMAT
+    return output_format
+
+
+def _encode(image: Image.Image, output_format: str, quality: int) -> bytes:
+    """PIL.Imageを指定形式のバイト列にエンコード"""
+    pil_format, _ = OUTPUT_FORMATS[output_format]
+    save_options: Dict[str, object] = {}
+    if output_format == "jpeg":
+        image = image.convert("RGB")
+        save_options = {"quality": quality, "optimize": True}
+    elif output_format == "webp":
+        save_options = {"quality": quality, "method": 4}
+    elif output_format == "avif":
+        save_options = {"quality": quality, "speed": 8}
+
+    buffer = BytesIO()
+    image.save(buffer, format=pil_format, **save_options)
+    return buffer.getvalue()
+
+
+def encode_generated_image(image_data: bytes, source_mime_type: str, options: ImageOutputOptions) -> EncodedImage:
+    """
+    生成画像を要求された形式・サイズに変換（CPU処理のため同期関数。通常は非同期版を使用する）
+
+    形式が同じでリサイズ・サムネイルも不要な場合は、デコードせずにそのままbase64エンコードする
+
+    Args:
+        image_data: 生成画像のバイト列
+        source_mime_type: 生成画像のMIMEタイプ
+        options: 出力画像の設定
+
+    Returns:
+        EncodedImage
+    """
+    output_format = resolve_output_format(options.output_format)
+    _, mime_type = OUTPUT_FORMATS[output_format]
+    image = Image.open(BytesIO(image_data))
+
+    if mime_type == source_mime_type and options.max_dimension is None and options.thumbnail_size is None:
+        # ヘッダーのみ読み込んだ状態でサイズを取得し、画素はデコードしない
+        width, height = image.size
+        return EncodedImage(
+            image_base64=base64.b64encode(image_data).decode('ascii'),
+            mime_type=mime_type,
+            width=width,
+            height=height
+        )
+
+    image.load()
+    if options.max_dimension is not None:
+        image.thumbnail((options.max_dimension, options.max_dimension), Image.Resampling.LANCZOS)
+    encoded = _encode(image, output_format, options.quality)
+
+    thumbnail_base64 = None
+    if options.thumbnail_size is not None:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((options.thumbnail_size, options.thumbnail_size), Image.Resampling.LANCZOS)
+        thumbnail_base64 = base64.b64encode(_encode(thumbnail, output_format, options.quality)).decode('ascii')
+
+    logger.info(
+        "Generated image encoded: %s %d bytes -> %s %d bytes, size=%s",
+        source_mime_type, len(image_data), mime_type, len(encoded), image.size
+    )
+    return EncodedImage(
+        image_base64=base64.b64encode(encoded).decode('ascii'),
+        mime_type=mime_type,
+        width=image.width,
+        height=image.height,
+        thumbnail_base64=thumbnail_base64
+    )
+
+
+_image_encode_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_image_encode_executor() -> ThreadPoolExecutor:
+    """
+    画像エンコード用のワーカースレッドプールを取得（ワーカー数は環境変数 IMAGE_ENCODE_WORKERS）
+
+    Returns:
+        ThreadPoolExecutor
+    """
+    global _image_encode_executor
+    if _image_encode_executor is None:
+        _image_encode_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("IMAGE_ENCODE_WORKERS", "2")),
+            thread_name_prefix="image-encode"
+        )
+    return _image_encode_executor
+
+
+def shutdown_image_encode_executor() -> None:
+    """ワーカースレッドプールを停止（サーバー終了時に呼び出す）"""
+    global _image_encode_executor
+    if _image_encode_executor is not None:
+        _image_encode_executor.shutdown(wait=False)
+        _image_encode_executor = None
+
+
+async def encode_generated_image_async(
+    image_data: bytes,
+    source_mime_type: str,
+    options: ImageOutputOptions
+) -> EncodedImage:
+    """
+    ワーカースレッドプールで生成画像を変換
+
+    Args:
+        image_data: 生成画像のバイト列
+        source_mime_type: 生成画像のMIMEタイプ
+        options: 出力画像の設定
+
+    Returns:
+        EncodedImage
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_image_encode_executor(),
+        partial(encode_generated_image, image_data, source_mime_type, options)
+    )
@@ -0,0 +1,243 @@
+"""
+モデル呼び出し前にローカルで画像品質（ぼやけ・露出・肌領域）を判定するモジュール
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import BinaryIO, List, Optional
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel, Field
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class ImageQualityError(Exception):
+    """画像品質が不十分な場合のエラー（メッセージはユーザー向けの改善方法を含む）"""
+
+
+class ImageQualityConfig(BaseModel):
+    """画像品質判定の閾値設定"""
+    enabled: bool = Field(True, description="品質判定を行うか")
+    max_side: int = Field(256, ge=32, description="判定用に縮小する画像の最大辺（ピクセル）")
+    min_blur_score: float = Field(25.0, ge=0, description="ラプラシアン分散の下限（未満はぼやけと判定）")
+    min_brightness: float = Field(50.0, ge=0, le=255, description="平均輝度の下限")
+    max_brightness: float = Field(215.0, ge=0, le=255, description="平均輝度の上限")
+    max_clipped_ratio: float = Field(0.6, ge=0, le=1, description="黒つぶれ・白とび画素の割合の上限")
+    min_skin_ratio: float = Field(0.03, ge=0, le=1, description="肌色画素の割合の下限（未満は顔なしと判定）")
+    min_chroma_spread: float = Field(
+        2.0, ge=0, description="色差（Cb/Cr）の標準偏差の下限（未満は白黒画像とみなし肌領域を判定しない）"
+    )
+    max_input_side: int = Field(4096, ge=1, description="受け付ける画像の最大辺（ピクセル、デコード前にヘッダーで判定）")
+
+    @classmethod
+    def from_env(cls) -> "ImageQualityConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            ImageQualityConfigインスタンス
+        """
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("IMAGE_QUALITY_GATE_ENABLED", "true").lower() == "true",
+            max_side=int(os.getenv("IMAGE_QUALITY_MAX_SIDE", defaults.max_side)),
+            min_blur_score=float(os.getenv("IMAGE_QUALITY_MIN_BLUR_SCORE", defaults.min_blur_score)),
+            min_brightness=float(os.getenv("IMAGE_QUALITY_MIN_BRIGHTNESS", defaults.min_brightness)),
+            max_brightness=float(os.getenv("IMAGE_QUALITY_MAX_BRIGHTNESS", defaults.max_brightness)),
+            max_clipped_ratio=float(os.getenv("IMAGE_QUALITY_MAX_CLIPPED_RATIO", defaults.max_clipped_ratio)),
+            min_skin_ratio=float(os.getenv("IMAGE_QUALITY_MIN_SKIN_RATIO", defaults.min_skin_ratio)),
+            min_chroma_spread=float(os.getenv("IMAGE_QUALITY_MIN_CHROMA_SPREAD", defaults.min_chroma_spread)),
+            max_input_side=int(os.getenv("IMAGE_QUALITY_MAX_INPUT_SIDE", defaults.max_input_side)),
+        )
+
+
+class ImageQualityReport(BaseModel):
+    """画像品質の判定結果"""
+    blur_score: float = Field(..., description="ラプラシアン分散（大きいほど鮮明）")
+    brightness: float = Field(..., description="平均輝度（0〜255）")
+    dark_ratio: float = Field(..., description="黒つぶれ画素の割合")
+    bright_ratio: float = Field(..., description="白とび画素の割合")
+    skin_ratio: float = Field(..., description="肌色画素の割合")
+    chroma_spread: float = Field(..., description="色差（Cb/Cr）の標準偏差の大きい方")
+    issues: List[str] = Field(default_factory=list, description="検出された問題（ユーザー向けメッセージ）")
+
+    @property
+    def passed(self) -> bool:
+        """品質判定に合格したか"""
+        return not self.issues
+
+
+def _to_small_rgb_array(image: Image.Image, max_side: int) -> np.ndarray:
+    """判定用に縮小したRGB配列を作成（縮小してから色変換する。元の画像オブジェクトは変更しない）"""
+    scale = min(1.0, max_side / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    small = image
+    if size != image.size:
+        # reducing_gapにより、まず整数倍の縮小（reduce）を行ってから補間する
+        small = image.resize(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return np.asarray(small.convert("RGB"), dtype=np.float32)
+
+
+def assess_image_quality(image: Image.Image, config: ImageQualityConfig) -> ImageQualityReport:
+    """
+    縮小画像に対してぼやけ・露出・肌領域を判定
+
+    Args:
+        image: 判定するPIL.Image
+        config: 判定の閾値設定
+
+    Returns:
+        ImageQualityReport
+    """
+    rgb = _to_small_rgb_array(image, config.max_side)
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    gray = 0.299 * red + 0.587 * green + 0.114 * blue
+
+    # ぼやけ: 4近傍ラプラシアンの分散
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    blur_score = float(laplacian.var())
+
+    # 露出: 輝度ヒストグラムから黒つぶれ・白とびの割合を算出
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    pixel_count = gray.size
+    brightness = float(gray.mean())
+    dark_ratio = float(histogram[:32].sum() / pixel_count)
+    bright_ratio = float(histogram[224:].sum() / pixel_count)
+
+    # 肌領域: YCbCr色空間での肌色範囲に入る画素の割合
+    cb = 128.0 - 0.168736 * red - 0.331264 * green + 0.5 * blue
+    cr = 128.0 + 0.5 * red - 0.418688 * green - 0.081312 * blue
+    skin_mask = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+    skin_ratio = float(skin_mask.mean())
+    # 白黒・セピア調の画像は色差がほぼ一定で肌色判定ができない
+    chroma_spread = float(max(cb.std(), cr.std()))
+
+    issues = []
+    if blur_score < config.min_blur_score:
+        issues.append("画像がぼやけています。ピントを合わせ、手ぶれしないように撮り直してください")
+    if brightness < config.min_brightness or dark_ratio > config.max_clipped_ratio:
+        issues.append("画像が暗すぎます。明るい場所で顔に光が当たるように撮り直してください")
+    if brightness > config.max_brightness or bright_ratio > config.max_clipped_ratio:
+        issues.append("画像が明るすぎます。逆光や強い照明を避けて撮り直してください")
+    if chroma_spread >= config.min_chroma_spread and skin_ratio < config.min_skin_ratio:
+        issues.append("顔が検出できませんでした。顔全体が写るように正面から撮影してください")
+
+    return ImageQualityReport(
+        blur_score=blur_score,
+        brightness=brightness,
+        dark_ratio=dark_ratio,
+        bright_ratio=bright_ratio,
+        skin_ratio=skin_ratio,
+        chroma_spread=chroma_spread,
+        issues=issues
+    )
+
+
+def _ensure_max_side(image: Image.Image, max_side: int) -> None:
+    """ヘッダーから読み取った画像サイズが上限を超える場合はエラーにする（画素はデコードしない）"""
+    if max(image.size) > max_side:
+        raise ImageQualityError(f"画像サイズが大きすぎます（最大{max_side}x{max_side}ピクセル）")
+
+
+def ensure_image_dimensions(file_obj: BinaryIO, config: ImageQualityConfig) -> None:
+    """
+    画像のヘッダーのみを読み込み、最大辺が上限を超える場合はエラーにする（品質判定の有効・無効によらず適用）
+
+    メモリ予算を見積もる前に呼び出し、デコード後のサイズが上限以下であることを保証する。
+    判定後はファイルポインタを先頭に戻す。
+
+    Args:
+        file_obj: アップロードされた画像のファイルオブジェクト
+        config: 判定の閾値設定
+
+    Raises:
+        ImageQualityError: 画像が読み込めない、またはサイズが上限を超える場合
+    """
+    try:
+        file_obj.seek(0)
+        image = Image.open(file_obj)
+    except Exception as e:
+        raise ImageQualityError(f"画像データを読み込めません。別の画像を選択してください: {str(e)}")
+    finally:
+        file_obj.seek(0)
+    _ensure_max_side(image, config.max_input_side)
+
+
+def ensure_upload_quality(file_obj: BinaryIO, config: ImageQualityConfig) -> None:
+    """
+    アップロードファイルの画像品質を判定し、不十分な場合はエラーにする
+
+    JPEGはdraftモードで縮小デコードするため、フル解像度の展開は行わない。
+    PNG・WebPはフル解像度でデコードしてから縮小するため、デコード前に画像サイズの上限を判定する。
+    判定後はファイルポインタを先頭に戻す。
+
+    Args:
+        file_obj: アップロードされた画像のファイルオブジェクト
+        config: 判定の閾値設定
+
+    Raises:
+        ImageQualityError: 画像が読み込めない、または品質が不十分な場合
+    """
+    if not config.enabled:
+        return
+
+    started_at = time.perf_counter()
+    try:
+        file_obj.seek(0)
+        image = Image.open(file_obj)
+        _ensure_max_side(image, config.max_input_side)
+        image.draft("RGB", (config.max_side, config.max_side))
+        report = assess_image_quality(image, config)
+    except ImageQualityError:
+        raise
+    except Exception as e:
+        raise ImageQualityError(f"画像データを読み込めません。別の画像を選択してください: {str(e)}")
+    finally:
+        file_obj.seek(0)
+
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    logger.info(
+        "Image quality assessed in %.1fms: blur=%.1f, brightness=%.1f, skin_ratio=%.3f",
+        elapsed_ms, report.blur_score, report.brightness, report.skin_ratio
+    )
+
+    if not report.passed:
+        raise ImageQualityError(" / ".join(report.issues))
+
+
+async def ensure_upload_quality_async(file_obj: BinaryIO, config: ImageQualityConfig) -> None:
+    """
+    ensure_upload_quality をワーカースレッドで実行（デコードでイベントループを止めない）
+
+    Args:
+        file_obj: アップロードされた画像のファイルオブジェクト
+        config: 判定の閾値設定
+
+    Raises:
+        ImageQualityError: 画像が読み込めない、または品質が不十分な場合
+    """
+    if not config.enabled:
+        return
+    await asyncio.to_thread(ensure_upload_quality, file_obj, config)
+
+
+_image_quality_config: Optional[ImageQualityConfig] = None
+
+
+def get_image_quality_config() -> ImageQualityConfig:
+    """
+    プロセス共有の画像品質判定設定を取得
+
+    Returns:
+        ImageQualityConfigインスタンス
+    """
+    global _image_quality_config
+    if _image_quality_config is None:
+        _image_quality_config = ImageQualityConfig.from_env()
+    return _image_quality_config
@@ -0,0 +1,239 @@
+"""
+処理中の画像データのバイト数をプロセス全体で制限するメモリ予算（バイト数で重み付けした非同期セマフォ）
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, BinaryIO, Deque, Dict, Optional, Tuple
+from PIL import Image
+from pydantic import BaseModel, Field
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudgetTimeoutError(Exception):
+    """メモリ予算の確保が時間内にできなかった場合のエラー"""
+
+
+class MemoryBudgetConfig(BaseModel):
+    """画像処理のメモリ予算の設定"""
+    budget_bytes: int = Field(192 * 1024 * 1024, ge=1, description="同時に処理できる画像データの合計バイト数")
+    acquire_timeout_seconds: float = Field(30.0, gt=0, description="予算の確保を待つ最大秒数")
+    generated_image_allowance_bytes: int = Field(
+        16 * 1024 * 1024, ge=0, description="生成画像（バイナリ・base64・JSONレスポンス）のために確保するバイト数"
+    )
+
+    @classmethod
+    def from_env(cls) -> "MemoryBudgetConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            MemoryBudgetConfigインスタンス
+        """
+        defaults = cls()
+        return cls(
+            budget_bytes=int(os.getenv("IMAGE_MEMORY_BUDGET_BYTES", defaults.budget_bytes)),
+            acquire_timeout_seconds=float(
+                os.getenv("IMAGE_MEMORY_BUDGET_TIMEOUT_SECONDS", defaults.acquire_timeout_seconds)
+            ),
+            generated_image_allowance_bytes=int(
+                os.getenv("IMAGE_MEMORY_GENERATED_ALLOWANCE_BYTES", defaults.generated_image_allowance_bytes)
+            ),
+        )
+
+
+class ByteBudget:
+    """バイト数で重み付けした先着順の非同期セマフォ"""
+
+    def __init__(self, capacity_bytes: int):
+        """
+        メモリ予算を初期化
+
+        Args:
+            capacity_bytes: 同時に確保できる合計バイト数
+        """
+        self.capacity_bytes = capacity_bytes
+        self._available = capacity_bytes
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def available_bytes(self) -> int:
+        """現在確保可能なバイト数"""
+        return self._available
+
+    async def acquire(self, size: int, timeout: Optional[float] = None) -> int:
+        """
+        指定バイト数を確保（不足している場合は解放されるまで待つ）
+
+        予算を超えるサイズは予算全体に切り詰めるため、単独であれば必ず処理できる
+
+        Args:
+            size: 確保するバイト数
+            timeout: 待機する最大秒数（Noneは無制限）
+
+        Returns:
+            実際に確保したバイト数（release()に渡す）
+
+        Raises:
+            MemoryBudgetTimeoutError: 時間内に確保できなかった場合
+        """
+        size = max(0, min(size, self.capacity_bytes))
+        if not self._waiters and self._available >= size:
+            self._available -= size
+            return size
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (size, future)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException as e:
+            # タイムアウト・キャンセル時は待ち行列から外す（同時に確保されていた場合は返却する）
+            if future.done() and not future.cancelled():
+                self.release(size)
+            else:
+                self._waiters.remove(waiter)
+                future.cancel()
+                self._wake_waiters()
+            if isinstance(e, asyncio.TimeoutError):
+                raise MemoryBudgetTimeoutError(f"メモリ予算を確保できませんでした: {size} bytes")
+            raise
+        return size
+
+    def try_acquire(self, size: int) -> Optional[int]:
+        """
+        待たずに確保できる場合のみ指定バイト数を確保（待機中のリクエストがある場合は確保しない）
+
+        Args:
+            size: 確保するバイト数
+
+        Returns:
+            実際に確保したバイト数（release()に渡す）。確保できない場合はNone
+        """
+        size = max(0, min(size, self.capacity_bytes))
+        if self._waiters or self._available < size:
+            return None
+        self._available -= size
+        return size
+
+    def release(self, size: int) -> None:
+        """
+        確保したバイト数を返却し、待機中のリクエストを先着順に再開
+
+        Args:
+            size: acquire()が返したバイト数
+        """
+        self._available += size
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._waiters[0][0] <= self._available:
+            size, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._available -= size
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, size: int, timeout: Optional[float] = None) -> AsyncIterator[int]:
+        """
+        with文の範囲でバイト数を確保
+
+        Args:
+            size: 確保するバイト数
+            timeout: 待機する最大秒数（Noneは無制限）
+        """
+        acquired = await self.acquire(size, timeout)
+        try:
+            yield acquired
+        finally:
+            self.release(acquired)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        メモリ予算の現在状態を取得（ヘルスチェック用）
+
+        Returns:
+            状態情報
+        """
+        return {
+            "capacity_bytes": self.capacity_bytes,
+            "available_bytes": self._available,
+            "waiting": len(self._waiters),
+        }
+
+
+def estimate_image_request_bytes(
+    file_obj: BinaryIO,
+    decodes_full_image: bool,
+    output_allowance_bytes: int = 0,
+    decodes_jpeg_draft: bool = False
+) -> int:
+    """
+    画像リクエストの処理中に保持されるバイト数を見積もる（ヘッダーのみ読み込み、画素はデコードしない）
+
+    内訳: アップロードの一時ファイル・読み込んだバイト列・リクエスト用base64（ファイルサイズの約3倍）
+         + フル解像度でデコードする場合はRGBA相当の画素データ + 出力用の確保分
+    JPEGをdraftモードで縮小デコードする場合、JPEGの画素データは見積もりに含めない
+
+    Args:
+        file_obj: アップロードされた画像のファイルオブジェクト
+        decodes_full_image: PILでフル解像度のデコードを行うか
+        output_allowance_bytes: 生成結果のために確保するバイト数
+        decodes_jpeg_draft: JPEGはdraftモードで縮小デコードするか（PNG・WebPはフル解像度）
+
+    Returns:
+        見積もりバイト数
+    """
+    file_obj.seek(0, 2)
+    file_size = file_obj.tell()
+    file_obj.seek(0)
+
+    decoded_size = 0
+    if decodes_full_image:
+        try:
+            image = Image.open(file_obj)
+            if not (decodes_jpeg_draft and image.format == "JPEG"):
+                width, height = image.size
+                decoded_size = width * height * 4
+        except Exception:
+            # 不正な画像は後続の検証でエラーにする
+            decoded_size = 0
+        finally:
+            file_obj.seek(0)
+
+    return file_size * 3 + decoded_size + output_allowance_bytes
+
+
+_memory_budget_config: Optional[MemoryBudgetConfig] = None
+_image_memory_budget: Optional[ByteBudget] = None
+
+
+def get_memory_budget_config() -> MemoryBudgetConfig:
+    """
+    プロセス共有のメモリ予算設定を取得
+
+    Returns:
+        MemoryBudgetConfigインスタンス
+    """
+    global _memory_budget_config
+    if _memory_budget_config is None:
+        _memory_budget_config = MemoryBudgetConfig.from_env()
+    return _memory_budget_config
+
+
+def get_image_memory_budget() -> ByteBudget:
+    """
+    プロセス共有の画像メモリ予算を取得
+
+    Returns:
+        ByteBudgetインスタンス
+    """
+    global _image_memory_budget
+    if _image_memory_budget is None:
+        _image_memory_budget = ByteBudget(get_memory_budget_config().budget_bytes)
+    return _image_memory_budget
@@ -0,0 +1,204 @@
+"""
+負荷・残りデッドラインに応じてモデルのティア（通常 / 軽量）を選択するポリシーエンジン
+"""
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+from pydantic import BaseModel, Field
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+PRIMARY_TIER = "primary"
+LITE_TIER = "lite"
+
+
+class ModelTierConfig(BaseModel):
+    """モデルティア選択ポリシーの設定"""
+    primary_model: str = Field("gemini-2.5-flash", description="通常時に使用するモデル名")
+    lite_model: str = Field("gemini-2.5-flash-lite", description="軽量ティアで使用するモデル名")
+    min_deadline_ms: int = Field(8000, ge=0, description="残りデッドラインがこの値未満なら軽量ティアを使用")
+    max_queue_depth: int = Field(8, ge=1, description="処理中リクエスト数がこの値以上なら軽量ティアを使用")
+    latency_slo_ms: int = Field(6000, ge=1, description="通常モデルのレイテンシSLO（p90）")
+    slo_window_size: int = Field(20, ge=1, description="SLO判定に使用する直近のレイテンシ件数")
+    slo_min_samples: int = Field(5, ge=1, description="SLO判定を行うのに必要な最小サンプル数")
+    slo_sample_ttl_seconds: float = Field(120.0, gt=0, description="SLO判定に使用するレイテンシの有効期間（秒）")
+    slo_probe_interval_seconds: float = Field(
+        10.0, gt=0, description="SLO違反中に回復確認のため通常モデルへ通すリクエストの間隔（秒）"
+    )
+
+    @classmethod
+    def from_env(cls) -> "ModelTierConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            ModelTierConfigインスタンス
+        """
+        defaults = cls()
+        return cls(
+            primary_model=os.getenv("MODEL_TIER_PRIMARY_MODEL", defaults.primary_model),
+            lite_model=os.getenv("MODEL_TIER_LITE_MODEL", defaults.lite_model),
+            min_deadline_ms=int(os.getenv("MODEL_TIER_MIN_DEADLINE_MS", defaults.min_deadline_ms)),
+            max_queue_depth=int(os.getenv("MODEL_TIER_MAX_QUEUE_DEPTH", defaults.max_queue_depth)),
+            latency_slo_ms=int(os.getenv("MODEL_TIER_LATENCY_SLO_MS", defaults.latency_slo_ms)),
+            slo_window_size=int(os.getenv("MODEL_TIER_SLO_WINDOW_SIZE", defaults.slo_window_size)),
+            slo_min_samples=int(os.getenv("MODEL_TIER_SLO_MIN_SAMPLES", defaults.slo_min_samples)),
+            slo_sample_ttl_seconds=float(
+                os.getenv("MODEL_TIER_SLO_SAMPLE_TTL_SECONDS", defaults.slo_sample_ttl_seconds)
+            ),
+            slo_probe_interval_seconds=float(
+                os.getenv("MODEL_TIER_SLO_PROBE_INTERVAL_SECONDS", defaults.slo_probe_interval_seconds)
+            ),
+        )
+
+
+class ModelTierDecision(BaseModel):
+    """モデルティアの選択結果"""
+    tier: str = Field(..., description="選択されたティア（primary / lite）")
+    model: str = Field(..., description="使用するモデル名")
+    reason: str = Field(..., description="ティアを選択した理由")
+
+
+class ModelTierPolicy:
+    """残りデッドライン・キュー深さ・レイテンシSLOからモデルティアを選択するクラス"""
+
+    def __init__(self, config: ModelTierConfig, clock: Callable[[], float] = time.monotonic):
+        """
+        ポリシーを初期化
+
+        Args:
+            config: ポリシー設定
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.config = config
+        self._clock = clock
+        self._in_flight = 0
+        # (記録時刻, レイテンシ) の直近サンプル
+        self._primary_latencies_ms: Deque[Tuple[float, float]] = deque(maxlen=config.slo_window_size)
+        self._last_slo_probe_at: Optional[float] = None
+
+    @property
+    def in_flight(self) -> int:
+        """現在処理中のモデル呼び出し数"""
+        return self._in_flight
+
+    def primary_latency_p90_ms(self) -> Optional[float]:
+        """
+        通常モデルの直近レイテンシのp90を計算
+
+        有効期間を過ぎたサンプルは破棄する（軽量ティアに切り替わった後も古い値で判定し続けないため）
+
+        Returns:
+            p90レイテンシ（ミリ秒）。サンプル不足の場合はNone
+        """
+        expires_before = self._clock() - self.config.slo_sample_ttl_seconds
+        while self._primary_latencies_ms and self._primary_latencies_ms[0][0] < expires_before:
+            self._primary_latencies_ms.popleft()
+        if len(self._primary_latencies_ms) < self.config.slo_min_samples:
+            return None
+        samples = sorted(latency_ms for _, latency_ms in self._primary_latencies_ms)
+        index = min(len(samples) - 1, int(len(samples) * 0.9))
+        return samples[index]
+
+    def is_slo_violated(self) -> bool:
+        """通常モデルのレイテンシSLOに違反しているか"""
+        p90 = self.primary_latency_p90_ms()
+        return p90 is not None and p90 > self.config.latency_slo_ms
+
+    def select(self, remaining_deadline_ms: Optional[float] = None) -> ModelTierDecision:
+        """
+        リクエストに使用するモデルティアを選択
+
+        Args:
+            remaining_deadline_ms: クライアントから通知された残りデッドライン（ミリ秒）
+
+        Returns:
+            ModelTierDecision
+        """
+        if remaining_deadline_ms is not None and remaining_deadline_ms < self.config.min_deadline_ms:
+            return self._lite(f"deadline_short({int(remaining_deadline_ms)}ms)")
+
+        if self._in_flight >= self.config.max_queue_depth:
+            return self._lite(f"queue_depth({self._in_flight})")
+
+        if self.is_slo_violated():
+            # 一定間隔で1件だけ通常モデルに通し、そのレイテンシで回復を判定する
+            now = self._clock()
+            if (
+                self._last_slo_probe_at is not None
+                and now - self._last_slo_probe_at < self.config.slo_probe_interval_seconds
+            ):
+                return self._lite(f"slo_violation(p90={int(self.primary_latency_p90_ms() or 0)}ms)")
+            self._last_slo_probe_at = now
+            return ModelTierDecision(
+                tier=PRIMARY_TIER,
+                model=self.config.primary_model,
+                reason="slo_probe"
+            )
+
+        return ModelTierDecision(
+            tier=PRIMARY_TIER,
+            model=self.config.primary_model,
+            reason="default"
+        )
+
+    @asynccontextmanager
+    async def track(self, decision: ModelTierDecision) -> AsyncIterator[None]:
+        """
+        モデル呼び出しをキュー深さ・レイテンシの計測対象として追跡
+
+        Args:
+            decision: select()で得たティア選択結果
+        """
+        self._in_flight += 1
+        started_at = self._clock()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            if decision.tier == PRIMARY_TIER:
+                finished_at = self._clock()
+                self._primary_latencies_ms.append((finished_at, (finished_at - started_at) * 1000))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        ポリシーの現在状態を取得（ヘルスチェック用）
+
+        Returns:
+            状態情報
+        """
+        return {
+            "in_flight": self._in_flight,
+            "primary_latency_p90_ms": self.primary_latency_p90_ms(),
+            "slo_violated": self.is_slo_violated(),
+            "primary_model": self.config.primary_model,
+            "lite_model": self.config.lite_model,
+        }
+
+    def _lite(self, reason: str) -> ModelTierDecision:
+        logger.info("Model tier downgraded to %s: %s", LITE_TIER, reason)
+        return ModelTierDecision(
+            tier=LITE_TIER,
+            model=self.config.lite_model,
+            reason=reason
+        )
+
+
+_model_tier_policy: Optional[ModelTierPolicy] = None
+
+
+def get_model_tier_policy() -> ModelTierPolicy:
+    """
+    プロセス共有のモデルティアポリシーを取得
+
+    Returns:
+        ModelTierPolicyインスタンス
+    """
+    global _model_tier_policy
+    if _model_tier_policy is None:
+        _model_tier_policy = ModelTierPolicy(ModelTierConfig.from_env())
+    return _model_tier_policy
@@ -0,0 +1,265 @@
+"""
+事前計算した診断結果テーブル（バージョン付きバイナリファイル）の書き込み・メモリマップ読み込み
+
+ファイル形式（リトルエンディアン）:
+- ヘッダー: マジック(4byte) / フォーマットバージョン(uint16) / バケット定義バージョン(uint16)
+           / スロット数(uint32) / エントリ数(uint32) / データ部オフセット(uint64)
+- スロット部: オープンアドレス法のハッシュテーブル（キー / データ部内オフセット / 長さ の uint32 x3）
+- データ部: 診断結果JSON（UTF-8）の連結
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+from .diagnose_from_text import (
+    CigaretteType,
+    Gender,
+    SmokingAnalysisRequest,
+    SmokingAnalysisResponse
+)
+from .diagnosis_reuse import is_reusable_request
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NSDX"
+FORMAT_VERSION = 1
+# バケットの区切りを変更した場合は必ず上げる（古いテーブルは読み込まない）
+BUCKET_SCHEME_VERSION = 1
+
+HEADER_STRUCT = struct.Struct("<4sHHIIQ")
+SLOT_DTYPE = np.dtype([("key", "<u4"), ("offset", "<u4"), ("length", "<u4")])
+EMPTY_KEY = 0xFFFFFFFF
+
+# バケットの区切り（値が区切り以上になるごとにバケット番号が1つ増える）
+AGE_EDGES = list(range(5, 121, 5))
+SMOKING_YEARS_EDGES = [1, 5, 10, 15, 20, 25, 30, 40, 50]
+DAILY_CIGARETTES_EDGES = [1, 6, 11, 16, 21, 31, 41]
+WEEKLY_FREQUENCY_EDGES = [1, 3, 5]
+SLEEP_HOURS_EDGES = [5, 6, 7, 8]
+
+_GENDERS = list(Gender)
+_CIGARETTE_TYPES = list(CigaretteType)
+
+
+def questionnaire_bucket_key(data: SmokingAnalysisRequest) -> int:
+    """
+    問診データをバケットに量子化し、混合基数で1つの整数キーにまとめる
+
+    Args:
+        data: 問診データ
+
+    Returns:
+        バケットキー
+    """
+    smoking_years = max(0, data.current_age - data.smoking_start_age)
+    digits = [
+        (bisect_right(AGE_EDGES, data.current_age), len(AGE_EDGES) + 1),
+        (bisect_right(SMOKING_YEARS_EDGES, smoking_years), len(SMOKING_YEARS_EDGES) + 1),
+        (bisect_right(DAILY_CIGARETTES_EDGES, data.daily_cigarettes), len(DAILY_CIGARETTES_EDGES) + 1),
+        (_GENDERS.index(data.gender), len(_GENDERS)),
+        (_CIGARETTE_TYPES.index(data.cigarette_type), len(_CIGARETTE_TYPES)),
+        (bisect_right(WEEKLY_FREQUENCY_EDGES, data.exercise_frequency), len(WEEKLY_FREQUENCY_EDGES) + 1),
+        (bisect_right(WEEKLY_FREQUENCY_EDGES, data.alcohol_consumption), len(WEEKLY_FREQUENCY_EDGES) + 1),
+        (bisect_right(SLEEP_HOURS_EDGES, data.sleep_hours), len(SLEEP_HOURS_EDGES) + 1),
+    ]
+    key = 0
+    for digit, radix in digits:
+        key = key * radix + digit
+    return key
+
+
+def _slot_index(key: int, mask: int) -> int:
+    """キーからスロット位置を計算（乗算ハッシュ）"""
+    return (key * 2654435761) & mask
+
+
+def write_precomputed_table(path: str, entries: Dict[int, bytes]) -> None:
+    """
+    バケットキーと診断結果JSONの組をテーブルファイルに書き込む（一時ファイル経由で置き換え）
+
+    Args:
+        path: 出力ファイルパス
+        entries: バケットキーと診断結果JSON（UTF-8）の辞書
+    """
+    slot_count = 8
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+    mask = slot_count - 1
+
+    slots = np.zeros(slot_count, dtype=SLOT_DTYPE)
+    slots["key"] = EMPTY_KEY
+    data_parts = []
+    data_size = 0
+    for key, payload in entries.items():
+        index = _slot_index(key, mask)
+        while slots["key"][index] != EMPTY_KEY:
+            index = (index + 1) & mask
+        slots[index] = (key, data_size, len(payload))
+        data_parts.append(payload)
+        data_size += len(payload)
+
+    data_offset = HEADER_STRUCT.size + slots.nbytes
+    header = HEADER_STRUCT.pack(
+        MAGIC, FORMAT_VERSION, BUCKET_SCHEME_VERSION, slot_count, len(entries), data_offset
+    )
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(slots.tobytes())
+        for payload in data_parts:
+            f.write(payload)
+    os.replace(temp_path, path)
+
+
+class PrecomputedDiagnosisTable:
+    """メモリマップしたテーブルファイルからO(1)で診断結果を引くクラス"""
+
+    def __init__(self, path: str):
+        """
+        テーブルファイルをメモリマップで開く（ヒープには読み込まない）
+
+        Args:
+            path: テーブルファイルのパス
+
+        Raises:
+            ValueError: ファイル形式・バージョンが不正な場合
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, format_version, bucket_version, slot_count, entry_count, data_offset = (
+                HEADER_STRUCT.unpack_from(self._mmap, 0)
+            )
+            if magic != MAGIC:
+                raise ValueError("事前計算テーブルのファイル形式が不正です")
+            if format_version != FORMAT_VERSION or bucket_version != BUCKET_SCHEME_VERSION:
+                raise ValueError(
+                    f"事前計算テーブルのバージョンが一致しません: format={format_version}, bucket={bucket_version}"
+                )
+            # マスクによるスロット計算には2の累乗、探索の終了には空きスロットが必要
+            if slot_count == 0 or slot_count & (slot_count - 1) or entry_count >= slot_count:
+                raise ValueError(
+                    f"事前計算テーブルのスロット数が不正です: slots={slot_count}, entries={entry_count}"
+                )
+            if data_offset != HEADER_STRUCT.size + slot_count * SLOT_DTYPE.itemsize or data_offset > len(self._mmap):
+                raise ValueError("事前計算テーブルのサイズが不正です")
+        except Exception:
+            self._mmap.close()
+            raise
+
+        self.entry_count = entry_count
+        self._slot_count = slot_count
+        self._mask = slot_count - 1
+        self._data_offset = data_offset
+        # スロット部はメモリマップ上のバッファをそのまま参照する（コピーしない）
+        self._slots = np.frombuffer(self._mmap, dtype=SLOT_DTYPE, count=slot_count, offset=HEADER_STRUCT.size)
+        self._lookups = 0
+        self._hits = 0
+
+    def lookup(self, data: SmokingAnalysisRequest) -> Optional[Tuple[SmokingAnalysisResponse, str]]:
+        """
+        問診データのバケットに対応する事前計算済みの診断結果を取得
+
+        Args:
+            data: 問診データ
+
+        Returns:
+            診断結果と生成したモデル名のタプル。見つからない場合はNone
+        """
+        if not is_reusable_request(data):
+            return None
+
+        self._lookups += 1
+        key = questionnaire_bucket_key(data)
+        index = _slot_index(key, self._mask)
+        # 壊れたテーブルでも無限ループしないよう、探索はスロット数までに制限する
+        for _ in range(self._slot_count):
+            slot_key, offset, length = self._slots[index]
+            if slot_key == EMPTY_KEY:
+                return None
+            if slot_key == key:
+                break
+            index = (index + 1) & self._mask
+        else:
+            return None
+
+        start = self._data_offset + int(offset)
+        payload = json.loads(self._mmap[start:start + int(length)])
+        self._hits += 1
+        return SmokingAnalysisResponse(
+            impact_on_appearance=payload["impact_on_appearance"],
+            predicted_impact=payload["predicted_impact"]
+        ), payload.get("model", "precomputed")
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        テーブルのメトリクスを取得
+
+        Returns:
+            メトリクス情報
+        """
+        return {
+            "path": self.path,
+            "entries": self.entry_count,
+            "lookups": self._lookups,
+            "hits": self._hits,
+            "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """メモリマップを解放"""
+        self._slots = None
+        self._mmap.close()
+
+
+_precomputed_table: Optional[PrecomputedDiagnosisTable] = None
+
+
+def load_precomputed_table() -> Optional[PrecomputedDiagnosisTable]:
+    """
+    環境変数 PRECOMPUTED_DIAGNOSES_PATH のテーブルをメモリマップで読み込む（サーバー起動時に呼び出す）
+
+    読み込みに失敗した場合はテーブルなしで動作を継続する
+
+    Returns:
+        PrecomputedDiagnosisTableインスタンス。未設定・読み込み失敗時はNone
+    """
+    global _precomputed_table
+    path = os.getenv("PRECOMPUTED_DIAGNOSES_PATH")
+    if not path:
+        return None
+
+    try:
+        _precomputed_table = PrecomputedDiagnosisTable(path)
+        logger.info("Precomputed diagnosis table loaded: %s, entries=%s", path, _precomputed_table.entry_count)
+    except Exception as e:
+        logger.error("Failed to load precomputed diagnosis table %s: %s", path, e)
+        _precomputed_table = None
+    return _precomputed_table
+
+
+def get_precomputed_table() -> Optional[PrecomputedDiagnosisTable]:
+    """
+    読み込み済みの事前計算テーブルを取得
+
+    Returns:
+        PrecomputedDiagnosisTableインスタンス。読み込まれていない場合はNone
+    """
+    return _precomputed_table
+
+
+def close_precomputed_table() -> None:
+    """事前計算テーブルを閉じる（サーバー終了時に呼び出す）"""
+    global _precomputed_table
+    if _precomputed_table is not None:
+        _precomputed_table.close()
+        _precomputed_table = None
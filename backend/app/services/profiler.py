@@ -0,0 +1,309 @@
+"""
+稼働中のプロセスを一定時間だけプロファイルするモジュール（管理者用エンドポイントから使用）
+
+- cpu: 別スレッドから全スレッドのスタックを一定間隔で採取する（サンプリング中以外は何も動かない）
+- memory: 期間中だけ tracemalloc を有効にし、確保されたまま残っているメモリを呼び出し元ごとに集計する
+
+結果は collapsed-stack 形式（flamegraph.pl 等）または speedscope 形式で出力する
+"""
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+CPU_MODE = "cpu"
+MEMORY_MODE = "memory"
+PROFILE_MODE_PATTERN = "^(cpu|memory)$"
+
+COLLAPSED_FORMAT = "collapsed"
+SPEEDSCOPE_FORMAT = "speedscope"
+PROFILE_OUTPUT_PATTERN = "^(collapsed|speedscope)$"
+
+# スタックの1フレーム（関数名, ファイル, 行番号）
+StackFrame = Tuple[str, str, int]
+
+
+class ProfilerBusyError(Exception):
+    """別のプロファイルを採取中の場合のエラー"""
+
+
+class ProfilerConfig(BaseModel):
+    """プロファイラーの設定"""
+    admin_token: Optional[str] = Field(None, description="管理者トークン（未設定の場合はエンドポイントを無効にする）")
+    max_duration_seconds: float = Field(30.0, gt=0, description="1回の採取の最大秒数")
+    max_stack_depth: int = Field(128, ge=1, description="採取するスタックの最大の深さ")
+    tracemalloc_frames: int = Field(25, ge=1, description="tracemallocで記録する呼び出し元のフレーム数")
+
+    @classmethod
+    def from_env(cls) -> "ProfilerConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            ProfilerConfigインスタンス
+        """
+        defaults = cls()
+        return cls(
+            admin_token=os.getenv("PROFILER_ADMIN_TOKEN") or None,
+            max_duration_seconds=float(os.getenv("PROFILER_MAX_DURATION_SECONDS", defaults.max_duration_seconds)),
+            max_stack_depth=int(os.getenv("PROFILER_MAX_STACK_DEPTH", defaults.max_stack_depth)),
+            tracemalloc_frames=int(os.getenv("PROFILER_TRACEMALLOC_FRAMES", defaults.tracemalloc_frames)),
+        )
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """ファイルパスをsys.pathからの相対パスに短縮"""
+    for prefix in sorted((path for path in sys.path if path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+class Profile:
+    """グループ（スレッド名など）ごとのスタックと重みの集計結果"""
+
+    def __init__(self, name: str, unit: str):
+        """
+        集計結果を初期化
+
+        Args:
+            name: プロファイル名
+            unit: 重みの単位（seconds / bytes）
+        """
+        self.name = name
+        self.unit = unit
+        self.stacks: Counter = Counter()
+
+    def add(self, group: str, frames: Tuple[StackFrame, ...], weight: float) -> None:
+        """
+        スタック（呼び出し元から順）の重みを加算
+
+        Args:
+            group: グループ名
+            frames: 呼び出し元から順に並べたフレーム
+            weight: 重み
+        """
+        self.stacks[(group, frames)] += weight
+
+    @staticmethod
+    def _frame_label(frame: StackFrame) -> str:
+        function_name, filename, line = frame
+        label = f"{function_name} ({filename}:{line})" if function_name else f"{filename}:{line}"
+        return label.replace(";", ":")
+
+    def to_collapsed(self) -> str:
+        """
+        collapsed-stack 形式（"グループ;呼び出し元;...;末端 重み" の行）に変換
+
+        秒単位の重みはマイクロ秒の整数にする
+
+        Returns:
+            collapsed-stack 形式のテキスト
+        """
+        scale = 1_000_000 if self.unit == "seconds" else 1
+        lines = []
+        for (group, frames), weight in self.stacks.most_common():
+            stack = ";".join([group.replace(";", ":")] + [self._frame_label(frame) for frame in frames])
+            lines.append(f"{stack} {max(1, round(weight * scale))}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """
+        speedscope のファイル形式（グループごとの sampled プロファイル）に変換
+
+        Returns:
+            speedscope 形式の辞書
+        """
+        frame_indexes: Dict[StackFrame, int] = {}
+        shared_frames: List[Dict[str, Any]] = []
+        profiles: Dict[str, Dict[str, Any]] = {}
+
+        for (group, frames), weight in self.stacks.items():
+            sample = []
+            for frame in frames:
+                if frame not in frame_indexes:
+                    frame_indexes[frame] = len(shared_frames)
+                    function_name, filename, line = frame
+                    shared_frames.append({"name": self._frame_label(frame), "file": filename, "line": line})
+                sample.append(frame_indexes[frame])
+            profile = profiles.setdefault(group, {
+                "type": "sampled",
+                "name": f"{self.name}: {group}",
+                "unit": self.unit,
+                "startValue": 0,
+                "endValue": 0,
+                "samples": [],
+                "weights": [],
+            })
+            profile["samples"].append(sample)
+            profile["weights"].append(weight)
+            profile["endValue"] += weight
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "no-smoking-for-you profiler",
+            "shared": {"frames": shared_frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+def sample_stacks(duration_seconds: float, interval_seconds: float, max_stack_depth: int) -> Profile:
+    """
+    呼び出し元スレッド以外の全スレッドのスタックを一定間隔で採取（ブロックするため別スレッドで実行する）
+
+    各サンプルの重みは前回の採取からの経過秒数
+
+    Args:
+        duration_seconds: 採取する秒数
+        interval_seconds: 採取の間隔（秒）
+        max_stack_depth: 採取するスタックの最大の深さ
+
+    Returns:
+        スレッド名ごとのProfile
+    """
+    profile = Profile(CPU_MODE, "seconds")
+    sampler_ident = threading.get_ident()
+    started_at = last_sampled_at = time.perf_counter()
+
+    while last_sampled_at - started_at < duration_seconds:
+        time.sleep(interval_seconds)
+        now = time.perf_counter()
+        weight = now - last_sampled_at
+        last_sampled_at = now
+
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == sampler_ident:
+                continue
+            frames: List[StackFrame] = []
+            while frame is not None and len(frames) < max_stack_depth:
+                code = frame.f_code
+                frames.append((code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            profile.add(thread_names.get(ident, f"thread-{ident}"), tuple(reversed(frames)), weight)
+        # 採取結果のフレームへの参照を残さない
+        del frame
+
+    return profile
+
+
+def snapshot_allocations(duration_seconds: float, tracemalloc_frames: int) -> Profile:
+    """
+    一定時間 tracemalloc を有効にし、確保されたまま残っているメモリを呼び出し元ごとに集計
+    （ブロックするため別スレッドで実行する）
+
+    既に tracemalloc が有効な場合は、有効にした時点からの確保が対象になる
+
+    Args:
+        duration_seconds: 計測する秒数
+        tracemalloc_frames: 記録する呼び出し元のフレーム数
+
+    Returns:
+        確保バイト数のProfile
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(tracemalloc_frames)
+    try:
+        time.sleep(duration_seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    profile = Profile(MEMORY_MODE, "bytes")
+    for statistic in snapshot.statistics("traceback"):
+        # tracemallocのフレームは呼び出し元から順に並んでいる
+        frames = tuple(("", _short_path(frame.filename), frame.lineno) for frame in statistic.traceback)
+        profile.add("allocations", frames, statistic.size)
+    return profile
+
+
+class ProcessProfiler:
+    """同時に1つだけプロファイルを採取するクラス"""
+
+    def __init__(self, config: ProfilerConfig):
+        """
+        プロファイラーを初期化
+
+        Args:
+            config: プロファイラーの設定
+        """
+        self.config = config
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """管理者トークンが設定されているか"""
+        return self.config.admin_token is not None
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        """
+        管理者トークンを検証（タイミング攻撃を避けるため定数時間で比較）
+
+        Args:
+            token: リクエストのトークン
+
+        Returns:
+            一致する場合True
+        """
+        admin_token = self.config.admin_token
+        if admin_token is None or token is None:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8"))
+
+    async def run(self, mode: str, duration_seconds: float, interval_seconds: float) -> Profile:
+        """
+        ワーカースレッドでプロファイルを採取（採取中もイベントループは処理を続ける）
+
+        Args:
+            mode: cpu または memory
+            duration_seconds: 採取する秒数（設定の最大値に切り詰める）
+            interval_seconds: cpuモードの採取間隔（秒）
+
+        Returns:
+            Profile
+
+        Raises:
+            ProfilerBusyError: 別のプロファイルを採取中の場合
+        """
+        if self._lock.locked():
+            raise ProfilerBusyError("別のプロファイルを採取中です")
+        duration_seconds = min(duration_seconds, self.config.max_duration_seconds)
+        async with self._lock:
+            if mode == MEMORY_MODE:
+                return await asyncio.to_thread(
+                    snapshot_allocations, duration_seconds, self.config.tracemalloc_frames
+                )
+            return await asyncio.to_thread(
+                sample_stacks, duration_seconds, interval_seconds, self.config.max_stack_depth
+            )
+
+
+_process_profiler: Optional[ProcessProfiler] = None
+
+
+def get_process_profiler() -> ProcessProfiler:
+    """
+    プロセス共有のプロファイラーを取得
+
+    Returns:
+        ProcessProfilerインスタンス
+    """
+    global _process_profiler
+    if _process_profiler is None:
+        _process_profiler = ProcessProfiler(ProfilerConfig.from_env())
+    return _process_profiler
@@ -0,0 +1,428 @@
+"""
+セッション・クライアントIPごとのトークンバケット方式のレート制限
+
+バックエンドは以下から選択できる（環境変数 RATE_LIMIT_BACKEND）
+- memory: プロセス内のメモリ（デフォルト、ワーカーごとに独立）
+- redis: Redisで複数ワーカー間で共有（redisパッケージと RATE_LIMIT_REDIS_URL が必要）
+"""
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel, Field
+
+from .generation_profile import (
+    ANALYZE_IMAGE_ENDPOINT,
+    DIAGNOSE_ENDPOINT,
+    GENERATE_IMAGE_ENDPOINT
+)
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# トークンバケットの指定（キー, 容量, 補充レート）
+BucketSpec = Tuple[str, float, float]
+
+# エンドポイントごとのデフォルトコスト（画像生成は診断より大幅に高い）
+DEFAULT_ENDPOINT_COSTS: Dict[str, float] = {
+    DIAGNOSE_ENDPOINT: 1.0,
+    ANALYZE_IMAGE_ENDPOINT: 2.0,
+    GENERATE_IMAGE_ENDPOINT: 10.0,
+}
+
+
+class RateLimitConfig(BaseModel):
+    """レート制限の設定"""
+    enabled: bool = Field(True, description="レート制限を行うか")
+    backend: str = Field("memory", description="バケットの保存先（memory / redis）")
+    redis_url: Optional[str] = Field(None, description="redisバックエンドの接続URL")
+    session_capacity: float = Field(30.0, gt=0, description="セッションごとのバケット容量")
+    session_refill_per_second: float = Field(0.5, gt=0, description="セッションごとの補充レート（トークン/秒）")
+    ip_capacity: float = Field(120.0, gt=0, description="クライアントIPごとのバケット容量")
+    ip_refill_per_second: float = Field(2.0, gt=0, description="クライアントIPごとの補充レート（トークン/秒）")
+    endpoint_costs: Dict[str, float] = Field(
+        default_factory=lambda: dict(DEFAULT_ENDPOINT_COSTS),
+        description="エンドポイントごとのコスト"
+    )
+    max_keys: int = Field(50000, ge=1, description="メモリバックエンドが保持する最大キー数")
+    idle_ttl_seconds: float = Field(600.0, gt=0, description="この時間アクセスのないキーを破棄")
+    trusted_proxy_hops: int = Field(
+        1, ge=0, description="X-Forwarded-Forを追記する信頼できるプロキシの段数（0はヘッダーを使用しない）"
+    )
+
+    @classmethod
+    def from_env(cls) -> "RateLimitConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            RateLimitConfigインスタンス
+        """
+        defaults = cls()
+        endpoint_costs = {
+            endpoint: float(os.getenv(f"RATE_LIMIT_COST_{endpoint.upper()}", cost))
+            for endpoint, cost in DEFAULT_ENDPOINT_COSTS.items()
+        }
+        return cls(
+            enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+            backend=os.getenv("RATE_LIMIT_BACKEND", defaults.backend),
+            redis_url=os.getenv("RATE_LIMIT_REDIS_URL"),
+            session_capacity=float(os.getenv("RATE_LIMIT_SESSION_CAPACITY", defaults.session_capacity)),
+            session_refill_per_second=float(
+                os.getenv("RATE_LIMIT_SESSION_REFILL_PER_SECOND", defaults.session_refill_per_second)
+            ),
+            ip_capacity=float(os.getenv("RATE_LIMIT_IP_CAPACITY", defaults.ip_capacity)),
+            ip_refill_per_second=float(os.getenv("RATE_LIMIT_IP_REFILL_PER_SECOND", defaults.ip_refill_per_second)),
+            endpoint_costs=endpoint_costs,
+            max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", defaults.max_keys)),
+            idle_ttl_seconds=float(os.getenv("RATE_LIMIT_IDLE_TTL_SECONDS", defaults.idle_ttl_seconds)),
+            trusted_proxy_hops=int(os.getenv("RATE_LIMIT_TRUSTED_PROXY_HOPS", defaults.trusted_proxy_hops)),
+        )
+
+
+class RateLimitResult(BaseModel):
+    """レート制限の判定結果"""
+    allowed: bool = Field(..., description="リクエストを許可するか")
+    limit: float = Field(..., description="バケット容量")
+    remaining: float = Field(..., description="残りトークン数")
+    reset_seconds: float = Field(..., description="バケットが満タンに戻るまでの秒数")
+    retry_after_seconds: float = Field(0.0, description="再試行可能になるまでの秒数（拒否時のみ）")
+
+    def to_headers(self) -> Dict[str, str]:
+        """
+        標準的なレート制限レスポンスヘッダーに変換
+
+        Returns:
+            ヘッダー名と値の辞書
+        """
+        headers = {
+            "RateLimit-Limit": str(int(self.limit)),
+            "RateLimit-Remaining": str(int(self.remaining)),
+            "RateLimit-Reset": str(math.ceil(self.reset_seconds)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after_seconds)))
+        return headers
+
+
+def refill_bucket(
+    tokens: float,
+    updated_at: float,
+    now: float,
+    capacity: float,
+    refill_per_second: float
+) -> float:
+    """経過時間に応じてトークンを補充した値を計算"""
+    elapsed = max(0.0, now - updated_at)
+    return min(capacity, tokens + elapsed * refill_per_second)
+
+
+def build_result(
+    allowed: bool,
+    tokens: float,
+    cost: float,
+    capacity: float,
+    refill_per_second: float
+) -> RateLimitResult:
+    """消費後のトークン数から判定結果を作成"""
+    retry_after = 0.0 if allowed else (cost - tokens) / refill_per_second
+    return RateLimitResult(
+        allowed=allowed,
+        limit=capacity,
+        remaining=tokens,
+        reset_seconds=(capacity - tokens) / refill_per_second,
+        retry_after_seconds=retry_after
+    )
+
+
+def resolve_client_ip(
+    forwarded_for: Optional[str],
+    peer_host: Optional[str],
+    trusted_proxy_hops: int
+) -> Optional[str]:
+    """
+    レート制限に使用するクライアントIPを決定
+
+    X-Forwarded-Forの先頭はクライアントが自由に設定できるため、右から trusted_proxy_hops 番目
+    （信頼できるプロキシが追記した値）を使用する。Cloud Runではフロントエンドが末尾に実際の
+    クライアントIPを追記するため、デフォルトの1段で末尾の値になる。
+
+    Args:
+        forwarded_for: X-Forwarded-Forヘッダーの値
+        peer_host: 接続元のアドレス
+        trusted_proxy_hops: 信頼できるプロキシの段数（0はヘッダーを使用しない）
+
+    Returns:
+        クライアントIP
+    """
+    if not forwarded_for or trusted_proxy_hops == 0:
+        return peer_host
+    entries = [entry.strip() for entry in forwarded_for.split(",") if entry.strip()]
+    if not entries:
+        return peer_host
+    # エントリが段数より少ない場合、すべて信頼できるプロキシが追記した値なので先頭を使う
+    return entries[max(0, len(entries) - trusted_proxy_hops)]
+
+
+class RateLimitBackend(ABC):
+    """トークンバケットの保存先の抽象クラス"""
+
+    @abstractmethod
+    async def consume(
+        self,
+        buckets: Sequence[BucketSpec],
+        cost: float,
+        now: float
+    ) -> List[RateLimitResult]:
+        """
+        すべてのバケットにコスト分のトークンがある場合のみ、すべてのバケットから消費する
+        （一部のバケットだけが消費されることはない）
+
+        Args:
+            buckets: (キー, 容量, 補充レート) のリスト
+            cost: 消費するトークン数
+            now: 現在時刻（UNIX秒）
+
+        Returns:
+            バケットごとのRateLimitResult（allowedはそのバケットのトークンが足りていたか）
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """プロセス内メモリのバックエンド（O(1)操作、キー数上限とアイドルキーの破棄あり）"""
+
+    def __init__(self, max_keys: int, idle_ttl_seconds: float):
+        """
+        メモリバックエンドを初期化
+
+        Args:
+            max_keys: 保持する最大キー数（超過時は最も古いキーから破棄）
+            idle_ttl_seconds: この時間アクセスのないキーを破棄
+        """
+        self.max_keys = max_keys
+        self.idle_ttl_seconds = idle_ttl_seconds
+        # キー -> (トークン数, 最終更新時刻)。最終アクセス順に並ぶ
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def consume(
+        self,
+        buckets: Sequence[BucketSpec],
+        cost: float,
+        now: float
+    ) -> List[RateLimitResult]:
+        self._evict_idle(now)
+
+        tokens_by_bucket = []
+        for key, capacity, refill_per_second in buckets:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens_by_bucket.append(capacity)
+            else:
+                tokens_by_bucket.append(refill_bucket(bucket[0], bucket[1], now, capacity, refill_per_second))
+        all_allowed = all(tokens >= cost for tokens in tokens_by_bucket)
+
+        results = []
+        for (key, capacity, refill_per_second), tokens in zip(buckets, tokens_by_bucket):
+            allowed = tokens >= cost
+            if all_allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            results.append(build_result(allowed, tokens, cost, capacity, refill_per_second))
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return results
+
+    def _evict_idle(self, now: float) -> None:
+        """先頭（最も古いアクセス）からアイドル状態のキーを破棄"""
+        while self._buckets:
+            oldest_key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at <= self.idle_ttl_seconds:
+                break
+            del self._buckets[oldest_key]
+
+
+# Redis上で複数のトークンバケットを原子的に更新するLuaスクリプト
+# ARGV: コスト, 現在時刻, 有効期限, 以降はキーごとに (容量, 補充レート)
+# すべてのバケットが足りる場合のみ消費し、{全体の許可, キーごとのトークン数...} を返す
+_REDIS_TOKEN_BUCKET_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local tokens = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 + i * 2])
+    local refill = tonumber(ARGV[3 + i * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local current = tonumber(bucket[1])
+    if current == nil then
+        current = capacity
+    else
+        current = math.min(capacity, current + math.max(0, now - tonumber(bucket[2])) * refill)
+    end
+    if current < cost then
+        allowed = 0
+    end
+    tokens[i] = current
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    if allowed == 1 then
+        tokens[i] = tokens[i] - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens[i]), 'updated_at', tostring(now))
+    redis.call('EXPIRE', key, ttl)
+    result[i + 1] = tostring(tokens[i])
+end
+return result
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Redisを使用した複数ワーカー共有のバックエンド"""
+
+    def __init__(self, redis_url: str, idle_ttl_seconds: float, key_prefix: str = "ratelimit:"):
+        """
+        Redisバックエンドを初期化
+
+        Args:
+            redis_url: Redisの接続URL
+            idle_ttl_seconds: キーの有効期限（秒）
+            key_prefix: Redisキーのプレフィックス
+
+        Raises:
+            Exception: redisパッケージがインストールされていない場合
+        """
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise Exception("redisバックエンドを使用するにはredisパッケージが必要です")
+
+        self.client = redis_asyncio.from_url(redis_url)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.key_prefix = key_prefix
+        self._script = self.client.register_script(_REDIS_TOKEN_BUCKET_SCRIPT)
+
+    async def consume(
+        self,
+        buckets: Sequence[BucketSpec],
+        cost: float,
+        now: float
+    ) -> List[RateLimitResult]:
+        args: List[float] = [cost, now, math.ceil(self.idle_ttl_seconds)]
+        for _, capacity, refill_per_second in buckets:
+            args.extend([capacity, refill_per_second])
+        all_allowed, *tokens_by_bucket = await self._script(
+            keys=[f"{self.key_prefix}{key}" for key, _, _ in buckets],
+            args=args
+        )
+
+        results = []
+        for (_, capacity, refill_per_second), tokens in zip(buckets, tokens_by_bucket):
+            tokens = float(tokens)
+            # 消費済みの場合は消費後のトークン数、拒否の場合は消費前のトークン数で判定する
+            allowed = bool(all_allowed) or tokens >= cost
+            results.append(build_result(allowed, tokens, cost, capacity, refill_per_second))
+        return results
+
+
+class RateLimiter:
+    """セッションIDとクライアントIPの両方にトークンバケットを適用するレート制限"""
+
+    def __init__(self, config: RateLimitConfig, backend: RateLimitBackend):
+        """
+        レート制限を初期化
+
+        Args:
+            config: レート制限の設定
+            backend: バケットの保存先
+        """
+        self.config = config
+        self.backend = backend
+
+    async def check(
+        self,
+        endpoint: str,
+        client_ip: Optional[str],
+        session_id: Optional[str] = None
+    ) -> RateLimitResult:
+        """
+        セッション・IPのすべてのバケットが足りる場合のみリクエストのコストを消費し、最も厳しい判定結果を返す
+
+        いずれかのバケットで拒否された場合は、どのバケットからも消費しない
+
+        Args:
+            endpoint: エンドポイント名（diagnose / analyze_image / generate_image）
+            client_ip: クライアントIP
+            session_id: セッションID
+
+        Returns:
+            RateLimitResult
+        """
+        cost = self.config.endpoint_costs.get(endpoint, 1.0)
+        now = time.time()
+
+        buckets: List[BucketSpec] = []
+        if session_id:
+            buckets.append((f"session:{session_id}", self.config.session_capacity, self.config.session_refill_per_second))
+        if client_ip:
+            buckets.append((f"ip:{client_ip}", self.config.ip_capacity, self.config.ip_refill_per_second))
+
+        if not buckets:
+            return RateLimitResult(allowed=True, limit=0, remaining=0, reset_seconds=0)
+
+        results = await self.backend.consume(buckets, cost, now)
+        for (key, _, _), result in zip(buckets, results):
+            if not result.allowed:
+                # 拒否はクライアントの挙動で大量に発生し得るため、サンプリング対象のINFOで記録する
+                logger.info("Rate limit exceeded: key=%s, endpoint=%s", key, endpoint)
+                return result
+
+        return min(results, key=lambda result: result.remaining / result.limit)
+
+
+def create_rate_limit_backend(config: RateLimitConfig) -> RateLimitBackend:
+    """
+    設定に応じたバックエンドを作成
+
+    Args:
+        config: レート制限の設定
+
+    Returns:
+        RateLimitBackendインスタンス
+
+    Raises:
+        ValueError: 不明なバックエンドが指定された場合
+    """
+    if config.backend == "memory":
+        return InMemoryRateLimitBackend(config.max_keys, config.idle_ttl_seconds)
+    if config.backend == "redis":
+        if not config.redis_url:
+            raise ValueError("RATE_LIMIT_REDIS_URLが設定されていません")
+        return RedisRateLimitBackend(config.redis_url, config.idle_ttl_seconds)
+    raise ValueError(f"不明なレート制限バックエンドです: {config.backend}")
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    プロセス共有のレート制限を取得
+
+    Returns:
+        RateLimiterインスタンス
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        config = RateLimitConfig.from_env()
+        _rate_limiter = RateLimiter(config, create_rate_limit_backend(config))
+    return _rate_limiter
@@ -0,0 +1,485 @@
+"""
+診断結果と顔写真が揃ったセッションについて、「20年後の顔」画像を先行して生成しておくモジュール（オプトイン）
+
+/api/diagnose と /api/analyze-image で受け取ったデータから画像生成用のプロンプトを組み立て、
+両方が揃った時点でバックグラウンドで生成を始める。後から届いた /api/generate-image は、
+プロンプト・画像が一致する場合に限り、生成済みの結果を返すか実行中の生成の完了を待つ。
+
+投機的な生成は余裕がある場合のみ行う（同時実行数の上限・メモリ予算の空きを待たずに確保できる場合のみ）。
+生成開始を待つ間に保持する顔写真もメモリ予算に計上し、確保できない場合は保持しない。
+生成を始める前に画像生成のコストをセッション・クライアントIPのレート制限に計上し、
+計上できない場合やセッションごとの開始回数の上限に達した場合は生成しない
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+from pydantic import BaseModel, Field
+
+from .diagnose_from_text import SmokingAnalysisRequest
+from .generate_image import generate_image_bytes_from_prompt
+from .generation_profile import GENERATE_IMAGE_ENDPOINT
+from .memory_budget import ByteBudget, get_image_memory_budget, get_memory_budget_config
+from .rate_limit import RateLimiter, get_rate_limiter
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+GenerateImageFunction = Callable[[str, bytes, str], Awaitable[Tuple[bytes, str]]]
+
+
+class SpeculationConfig(BaseModel):
+    """投機的な画像生成の設定"""
+    enabled: bool = Field(False, description="投機的な画像生成を行うか（オプトイン）")
+    max_inflight: int = Field(2, ge=1, description="同時に実行する投機的な生成の最大数")
+    max_sessions: int = Field(50, ge=1, description="保持するセッションの最大数（超過時は古いものから破棄）")
+    ttl_seconds: float = Field(300.0, gt=0, description="最後の更新から結果を保持する秒数")
+    max_image_bytes: int = Field(4 * 1024 * 1024, ge=1, description="投機的な生成の対象にする画像の最大バイト数")
+    min_free_budget_ratio: float = Field(
+        0.5, ge=0, le=1, description="確保後もメモリ予算にこの割合の空きが残る場合のみ生成する"
+    )
+    max_starts_per_session: int = Field(
+        3, ge=1, description="1セッションで開始する投機的な生成の最大回数（入力の差し替えによる再生成を含む）"
+    )
+
+    @classmethod
+    def from_env(cls) -> "SpeculationConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            SpeculationConfigインスタンス
+        """
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("SPECULATIVE_IMAGE_ENABLED", "false").lower() == "true",
+            max_inflight=int(os.getenv("SPECULATIVE_IMAGE_MAX_INFLIGHT", defaults.max_inflight)),
+            max_sessions=int(os.getenv("SPECULATIVE_IMAGE_MAX_SESSIONS", defaults.max_sessions)),
+            ttl_seconds=float(os.getenv("SPECULATIVE_IMAGE_TTL_SECONDS", defaults.ttl_seconds)),
+            max_image_bytes=int(os.getenv("SPECULATIVE_IMAGE_MAX_IMAGE_BYTES", defaults.max_image_bytes)),
+            min_free_budget_ratio=float(
+                os.getenv("SPECULATIVE_IMAGE_MIN_FREE_BUDGET_RATIO", defaults.min_free_budget_ratio)
+            ),
+            max_starts_per_session=int(
+                os.getenv("SPECULATIVE_IMAGE_MAX_STARTS_PER_SESSION", defaults.max_starts_per_session)
+            ),
+        )
+
+
+def build_generation_prompt(questionnaire: SmokingAnalysisRequest, predicted_impact: str) -> str:
+    """
+    画像生成用のプロンプトを組み立てる（フロントエンドの QuestionnaireForm と同じ形式）
+
+    Args:
+        questionnaire: 問診データ
+        predicted_impact: 診断結果の将来予測
+
+    Returns:
+        画像生成用のプロンプト
+    """
+    return (
+        f"his/her age: {questionnaire.current_age}, "
+        f"his/her smoking habit: {questionnaire.daily_cigarettes} cigarettes/day,"
+        f"start smoking: {questionnaire.smoking_start_age} "
+        f"future predicted effects: {predicted_impact}"
+    ).strip()
+
+
+def _image_digest(image_data: bytes) -> bytes:
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+def _fingerprint(prompt: str, image_digest: bytes, mime_type: str) -> bytes:
+    return hashlib.blake2b(
+        prompt.encode("utf-8") + b"\0" + mime_type.encode("utf-8") + b"\0" + image_digest,
+        digest_size=16
+    ).digest()
+
+
+class _SessionSpeculation:
+    """1セッション分の入力と投機的な生成の状態"""
+
+    def __init__(self, session_id: str, now: float):
+        self.session_id = session_id
+        self.client_ip: Optional[str] = None
+        self.prompt: Optional[str] = None
+        self.image_data: Optional[bytes] = None
+        self.image_digest: Optional[bytes] = None
+        self.mime_type: Optional[str] = None
+        self.fingerprint: Optional[bytes] = None
+        self.task: Optional[asyncio.Task] = None
+        self.reserved_bytes = 0
+        self.photo_reserved_bytes = 0
+        self.charged = False
+        self.starts = 0
+        self.updated_at = now
+
+
+class SpeculativeImageGenerator:
+    """セッションごとに画像を先行生成し、後続のリクエストに引き渡すクラス"""
+
+    def __init__(
+        self,
+        config: SpeculationConfig,
+        budget: ByteBudget,
+        generated_image_allowance_bytes: int,
+        generate: GenerateImageFunction = generate_image_bytes_from_prompt,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        """
+        投機的な画像生成を初期化
+
+        Args:
+            config: 投機的な画像生成の設定
+            budget: 画像処理のメモリ予算
+            generated_image_allowance_bytes: 生成結果のために確保するバイト数
+            generate: 画像生成関数（プロンプト, 参考画像, MIMEタイプ）
+            rate_limiter: 画像生成のコストを計上するレート制限（Noneの場合は計上しない）
+        """
+        self.config = config
+        self.budget = budget
+        self.generated_image_allowance_bytes = generated_image_allowance_bytes
+        self._generate = generate
+        self.rate_limiter = rate_limiter
+        self._sessions: "OrderedDict[str, _SessionSpeculation]" = OrderedDict()
+        self._started = 0
+        self._warm_hits = 0
+        self._inflight_hits = 0
+        self._mismatches = 0
+        self._wasted = 0
+        self._failed = 0
+        self._skipped = 0
+        self._rate_limited = 0
+        self._restart_limited = 0
+
+    def record_diagnosis(
+        self,
+        session_id: Optional[str],
+        client_ip: Optional[str],
+        questionnaire: SmokingAnalysisRequest,
+        predicted_impact: str
+    ) -> None:
+        """
+        診断結果を記録し、顔写真が揃っていれば先行生成を開始
+
+        Args:
+            session_id: セッションID
+            client_ip: クライアントIP（レート制限の計上先）
+            questionnaire: 問診データ
+            predicted_impact: 診断結果の将来予測
+        """
+        if not self.config.enabled or not session_id:
+            return
+        state = self._get_state(session_id)
+        state.client_ip = client_ip
+        prompt = build_generation_prompt(questionnaire, predicted_impact)
+        if state.prompt != prompt:
+            self._discard_job(state)
+            state.prompt = prompt
+        self._maybe_start(state)
+
+    def record_photo(
+        self,
+        session_id: Optional[str],
+        client_ip: Optional[str],
+        file_obj: BinaryIO,
+        mime_type: Optional[str]
+    ) -> None:
+        """
+        顔写真を記録し、診断結果が揃っていれば先行生成を開始（読み込み後にファイルを先頭に戻す）
+
+        Args:
+            session_id: セッションID
+            client_ip: クライアントIP（レート制限の計上先）
+            file_obj: アップロードされた画像のファイルオブジェクト
+            mime_type: 画像のMIMEタイプ
+        """
+        if not self.config.enabled or not session_id or not mime_type:
+            return
+        file_obj.seek(0, 2)
+        file_size = file_obj.tell()
+        file_obj.seek(0)
+        if file_size > self.config.max_image_bytes:
+            return
+        image_data = file_obj.read()
+        file_obj.seek(0)
+
+        state = self._get_state(session_id)
+        state.client_ip = client_ip
+        image_digest = _image_digest(image_data)
+        if state.image_digest != image_digest or state.mime_type != mime_type:
+            self._discard_job(state)
+            self._drop_photo(state)
+            state.image_digest = image_digest
+            state.mime_type = mime_type
+            if not self._store_photo(state, image_data):
+                return
+        self._maybe_start(state)
+
+    def is_charged(self, session_id: Optional[str]) -> bool:
+        """
+        セッションの先行生成が画像生成のコストをレート制限に計上済みか
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            計上済みの先行生成がある場合True
+        """
+        if not self.config.enabled or not session_id:
+            return False
+        state = self._sessions.get(session_id)
+        return state is not None and state.charged
+
+    async def claim(
+        self,
+        session_id: Optional[str],
+        prompt: str,
+        image_data: bytes,
+        mime_type: Optional[str]
+    ) -> Optional[Tuple[bytes, str]]:
+        """
+        プロンプト・画像が一致する先行生成があれば、その結果を受け取る（実行中の場合は完了を待つ）
+
+        一致しない先行生成は無駄になったものとして破棄する
+
+        Args:
+            session_id: セッションID
+            prompt: リクエストのプロンプト
+            image_data: リクエストの参考画像
+            mime_type: 参考画像のMIMEタイプ
+
+        Returns:
+            生成された画像のバイト列とMIMEタイプ。使える先行生成がない場合はNone
+        """
+        if not self.config.enabled or not session_id or not mime_type:
+            return None
+        self._evict_expired(time.monotonic())
+        state = self._sessions.get(session_id)
+        if state is None or state.task is None:
+            return None
+        if state.fingerprint != _fingerprint(prompt, _image_digest(image_data), mime_type):
+            self._mismatches += 1
+            self._discard_session(session_id)
+            return None
+
+        # 以降はこのリクエストが結果を引き取る
+        self._sessions.pop(session_id)
+        task = state.task
+        in_flight = not task.done()
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # 引き取ったリクエスト自体がキャンセルされた場合は生成も止める
+                task.cancel()
+                self._wasted += 1
+            raise
+        except Exception:
+            # 失敗は完了時に記録済み。呼び出し元で通常の生成を行う
+            return None
+        finally:
+            self._release(state)
+
+        if result is None:
+            # レート制限で生成しなかった
+            return None
+        if in_flight:
+            self._inflight_hits += 1
+        else:
+            self._warm_hits += 1
+        logger.info("Speculative image served for session: %s (in_flight=%s)", session_id, in_flight)
+        return result
+
+    def _get_state(self, session_id: str) -> _SessionSpeculation:
+        now = time.monotonic()
+        self._evict_expired(now)
+        state = self._sessions.get(session_id)
+        if state is None:
+            while len(self._sessions) >= self.config.max_sessions:
+                self._discard_session(next(iter(self._sessions)))
+            state = _SessionSpeculation(session_id, now)
+            self._sessions[session_id] = state
+        else:
+            state.updated_at = now
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def _evict_expired(self, now: float) -> None:
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.updated_at < self.config.ttl_seconds:
+                break
+            self._discard_session(session_id)
+
+    def _inflight_count(self) -> int:
+        return sum(1 for state in self._sessions.values() if state.task is not None and not state.task.done())
+
+    def _try_reserve(self, size: int) -> Optional[int]:
+        """通常のリクエストを待たせないよう、確保後も十分な空きが残る場合のみ待たずに確保する"""
+        min_free_bytes = self.budget.capacity_bytes * self.config.min_free_budget_ratio
+        if self.budget.available_bytes - size < min_free_bytes:
+            return None
+        return self.budget.try_acquire(size)
+
+    def _store_photo(self, state: _SessionSpeculation, image_data: bytes) -> bool:
+        """顔写真をメモリ予算に計上して保持（開始回数の上限に達した場合・予算に余裕がない場合は保持しない）"""
+        if state.starts >= self.config.max_starts_per_session:
+            # 写真の差し替えを繰り返して生成を何度もやり直させない
+            self._restart_limited += 1
+            return False
+        reserved = self._try_reserve(len(image_data))
+        if reserved is None:
+            self._skipped += 1
+            return False
+        state.image_data = image_data
+        state.photo_reserved_bytes = reserved
+        return True
+
+    def _drop_photo(self, state: _SessionSpeculation) -> None:
+        state.image_data = None
+        if state.photo_reserved_bytes:
+            self.budget.release(state.photo_reserved_bytes)
+            state.photo_reserved_bytes = 0
+
+    def _maybe_start(self, state: _SessionSpeculation) -> None:
+        prompt, image_data = state.prompt, state.image_data
+        image_digest, mime_type = state.image_digest, state.mime_type
+        if state.task is not None or prompt is None or image_data is None:
+            return
+        if image_digest is None or mime_type is None:
+            return
+        if self._inflight_count() >= self.config.max_inflight:
+            self._skipped += 1
+            return
+
+        # 写真の分は確保済みのため、生成に必要な残りの分だけ追加で確保する
+        size = len(image_data) * 3 + self.generated_image_allowance_bytes
+        reserved = self._try_reserve(size - state.photo_reserved_bytes)
+        if reserved is None:
+            self._skipped += 1
+            return
+
+        state.reserved_bytes = reserved + state.photo_reserved_bytes
+        state.photo_reserved_bytes = 0
+        state.fingerprint = _fingerprint(prompt, image_digest, mime_type)
+        state.task = asyncio.create_task(self._run_job(state, prompt, image_data, mime_type))
+        state.task.add_done_callback(lambda task: self._on_job_done(state, task))
+        # 参考画像は生成タスクが保持するため、セッション側では解放する
+        state.image_data = None
+        state.starts += 1
+        self._started += 1
+
+    async def _run_job(
+        self,
+        state: _SessionSpeculation,
+        prompt: str,
+        image_data: bytes,
+        mime_type: str
+    ) -> Optional[Tuple[bytes, str]]:
+        """画像生成のコストをレート制限に計上してから生成（計上できない場合はNone）"""
+        if self.rate_limiter is not None and self.rate_limiter.config.enabled:
+            result = await self.rate_limiter.check(GENERATE_IMAGE_ENDPOINT, state.client_ip, state.session_id)
+            if not result.allowed:
+                return None
+            state.charged = True
+        return await self._generate(prompt, image_data, mime_type)
+
+    def _on_job_done(self, state: _SessionSpeculation, task: asyncio.Task) -> None:
+        if not task.cancelled():
+            if task.exception() is not None:
+                self._failed += 1
+                self._release(state)
+                logger.warning("Speculative image generation failed: %s", task.exception())
+            elif task.result() is None:
+                self._rate_limited += 1
+                self._release(state)
+                logger.info("Speculative image skipped by rate limit for session: %s", state.session_id)
+        self._start_pending()
+
+    def _start_pending(self) -> None:
+        for state in list(self._sessions.values()):
+            if self._inflight_count() >= self.config.max_inflight:
+                return
+            if state.task is None and state.image_data is not None and state.prompt is not None:
+                self._maybe_start(state)
+
+    def _release(self, state: _SessionSpeculation) -> None:
+        if state.reserved_bytes:
+            self.budget.release(state.reserved_bytes)
+            state.reserved_bytes = 0
+
+    def _discard_job(self, state: _SessionSpeculation) -> None:
+        """入力が変わったセッションの先行生成を破棄"""
+        if state.task is None:
+            return
+        task = state.task
+        if not task.done():
+            task.cancel()
+            self._wasted += 1
+        elif not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._wasted += 1
+        state.task = None
+        state.fingerprint = None
+        state.charged = False
+        self._release(state)
+
+    def _discard_session(self, session_id: str) -> None:
+        state = self._sessions.pop(session_id)
+        self._discard_job(state)
+        self._drop_photo(state)
+
+    async def shutdown(self) -> None:
+        """実行中の先行生成をすべて停止（サーバー終了時に呼び出す）"""
+        tasks = [state.task for state in self._sessions.values() if state.task is not None]
+        for session_id in list(self._sessions):
+            self._discard_session(session_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        投機的な生成の統計情報を取得（ヘルスチェック用）
+
+        Returns:
+            統計情報
+        """
+        return {
+            "enabled": self.config.enabled,
+            "sessions": len(self._sessions),
+            "in_flight": self._inflight_count(),
+            "held_photo_bytes": sum(state.photo_reserved_bytes for state in self._sessions.values()),
+            "started": self._started,
+            "warm_hits": self._warm_hits,
+            "in_flight_hits": self._inflight_hits,
+            "mismatches": self._mismatches,
+            "wasted": self._wasted,
+            "wasted_ratio": self._wasted / self._started if self._started else 0.0,
+            "failed": self._failed,
+            "skipped": self._skipped,
+            "rate_limited": self._rate_limited,
+            "restart_limited": self._restart_limited,
+        }
+
+
+_speculative_image_generator: Optional[SpeculativeImageGenerator] = None
+
+
+def get_speculative_image_generator() -> SpeculativeImageGenerator:
+    """
+    プロセス共有の投機的な画像生成を取得
+
+    Returns:
+        SpeculativeImageGeneratorインスタンス
+    """
+    global _speculative_image_generator
+    if _speculative_image_generator is None:
+        _speculative_image_generator = SpeculativeImageGenerator(
+            SpeculationConfig.from_env(),
+            get_image_memory_budget(),
+            get_memory_budget_config().generated_image_allowance_bytes,
+            rate_limiter=get_rate_limiter()
+        )
+    return _speculative_image_generator
@@ -0,0 +1,234 @@
+"""
+キュー経由でバックグラウンドスレッドに書き出す構造化ログ（JSON）の設定モジュール
+
+リクエスト処理側ではログレコードをキューに積むだけにし、メッセージの組み立て・JSON化・出力は
+書き出しスレッドで行う。件数の多いINFO以下のログはレベルごとにサンプリングし、
+プロンプトなどの大きな項目は伏せ字・切り詰めを行う。
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, TextIO
+from pydantic import BaseModel, Field
+
+# LogRecordが標準で持つ属性（これ以外はextraで渡された項目として出力する）
+_RESERVED_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class LoggingConfig(BaseModel):
+    """ログ出力の設定"""
+    level: str = Field("INFO", description="出力するログレベル")
+    json_format: bool = Field(True, description="JSON形式で出力するか（Falseの場合はテキスト形式）")
+    sample_rates: Dict[str, float] = Field(
+        default_factory=dict, description="レベルごとの出力割合（WARNING以上は常に出力）"
+    )
+    queue_size: int = Field(10000, ge=1, description="書き出し待ちのキューの最大件数")
+    max_field_length: int = Field(200, ge=16, description="文字列項目の最大文字数")
+    redact_fields: List[str] = Field(
+        default_factory=lambda: ["prompt"], description="値を伏せ字にする項目名"
+    )
+
+    @classmethod
+    def from_env(cls) -> "LoggingConfig":
+        """
+        環境変数から設定を読み込む
+
+        LOG_SAMPLE_RATES は "DEBUG=0.1,INFO=0.5" の形式で指定する
+
+        Returns:
+            LoggingConfigインスタンス
+        """
+        defaults = cls()
+        sample_rates: Dict[str, float] = {}
+        for item in os.getenv("LOG_SAMPLE_RATES", "").split(","):
+            if "=" not in item:
+                continue
+            level_name, rate = item.split("=", 1)
+            sample_rates[level_name.strip().upper()] = float(rate)
+        redact_text = os.getenv("LOG_REDACT_FIELDS")
+        return cls(
+            level=os.getenv("LOG_LEVEL", defaults.level).upper(),
+            json_format=os.getenv("LOG_FORMAT", "json").lower() == "json",
+            sample_rates=sample_rates,
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", defaults.queue_size)),
+            max_field_length=int(os.getenv("LOG_MAX_FIELD_LENGTH", defaults.max_field_length)),
+            redact_fields=(
+                [field.strip() for field in redact_text.split(",") if field.strip()]
+                if redact_text is not None else defaults.redact_fields
+            ),
+        )
+
+
+class LoggingMetrics:
+    """サンプリング・キュー溢れで出力しなかったログの件数"""
+
+    def __init__(self):
+        self.sampled_out = 0
+        self.dropped_queue_full = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        """件数を辞書に変換"""
+        return {
+            "sampled_out": self.sampled_out,
+            "dropped_queue_full": self.dropped_queue_full,
+        }
+
+
+class LevelSamplingFilter(logging.Filter):
+    """INFO以下のログをレベルごとの割合で間引くフィルター"""
+
+    def __init__(self, sample_rates: Dict[str, float], metrics: LoggingMetrics):
+        super().__init__()
+        self.sample_rates = {
+            logging.getLevelName(level_name): rate
+            for level_name, rate in sample_rates.items()
+            if isinstance(logging.getLevelName(level_name), int)
+        }
+        self.metrics = metrics
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.metrics.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    ログレコードを整形せずにキューへ積むハンドラー
+
+    メッセージの組み立ては書き出しスレッドで行うため、ログの引数には後から変更されない値を渡す。
+    キューが一杯の場合は待たずに破棄する。
+    """
+
+    def __init__(self, log_queue: queue.Queue, metrics: LoggingMetrics):
+        super().__init__(log_queue)
+        self.metrics = metrics
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一プロセス内のキューなので、標準実装のような整形・コピーは行わない
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.metrics.dropped_queue_full += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに変換するフォーマッター"""
+
+    def __init__(self, max_field_length: int, redact_fields: List[str]):
+        super().__init__()
+        self.max_field_length = max_field_length
+        self.redact_fields = set(redact_fields)
+
+    def _sanitize(self, key: str, value: Any) -> Any:
+        if key in self.redact_fields:
+            return f"<redacted {len(str(value))} chars>"
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        if isinstance(value, (dict, list, tuple)):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        value = str(value)
+        if len(value) > self.max_field_length:
+            return f"{value[:self.max_field_length]}...<truncated {len(value) - self.max_field_length} chars>"
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_RECORD_ATTRIBUTES and not key.startswith("_"):
+                payload[key] = self._sanitize(key, value)
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+_queue_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_logging_metrics = LoggingMetrics()
+
+
+def configure_logging(config: Optional[LoggingConfig] = None, stream: Optional[TextIO] = None) -> None:
+    """
+    ルートロガーにキュー経由のハンドラーを設定し、書き出しスレッドを開始
+
+    既に設定済みの場合は書き出しスレッドを止めてから設定し直す
+
+    Args:
+        config: ログ出力の設定（省略時は環境変数から読み込む）
+        stream: 出力先（省略時は標準エラー出力）
+    """
+    global _queue_listener, _queue_handler
+    config = config or LoggingConfig.from_env()
+    stop_logging()
+
+    if config.json_format:
+        formatter: logging.Formatter = JsonFormatter(config.max_field_length, config.redact_fields)
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    output_handler = logging.StreamHandler(stream or sys.stderr)
+    output_handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=config.queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue, _logging_metrics)
+    queue_handler.addFilter(LevelSamplingFilter(config.sample_rates, _logging_metrics))
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(config.level)
+
+    _queue_handler = queue_handler
+    _queue_listener = QueueListener(log_queue, output_handler)
+    _queue_listener.start()
+
+
+def stop_logging() -> None:
+    """
+    書き出しスレッドを停止（キューに残ったログは書き出してから終了する）
+
+    停止後のログは出力先のハンドラーへ直接書き出す
+    """
+    global _queue_listener, _queue_handler
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        root_logger = logging.getLogger()
+        queue_handler = _queue_handler
+        if queue_handler is not None:
+            root_logger.removeHandler(queue_handler)
+        for output_handler in _queue_listener.handlers:
+            root_logger.addHandler(output_handler)
+        _queue_listener = None
+        _queue_handler = None
+
+
+def get_logging_metrics() -> Dict[str, int]:
+    """
+    出力しなかったログの件数を取得（ヘルスチェック用）
+
+    Returns:
+        件数の辞書
+    """
+    return _logging_metrics.to_dict()
+
+
+# 正常終了時にキューに残ったログを書き出す
+atexit.register(stop_logging)
@@ -0,0 +1,226 @@
+"""
+バックグラウンドで各モデルに最小限のリクエストを送り、レイテンシ・エラー率・サーキット状態を記録するモジュール
+
+liveness / readiness エンドポイントはここで記録した状態を参照するだけで応答する
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+from .model_tier import get_model_tier_policy
+from .vertex_ai import get_vertex_ai_service
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class UpstreamProbeConfig(BaseModel):
+    """バックグラウンド疎通確認の設定"""
+    enabled: bool = Field(True, description="バックグラウンドの疎通確認を行うか")
+    models: List[str] = Field(default_factory=list, description="確認するモデル名（空の場合はモデルティアの設定から取得）")
+    interval_seconds: float = Field(30.0, gt=0, description="確認の間隔（秒）")
+    jitter_seconds: float = Field(5.0, ge=0, description="間隔に加えるランダムな揺らぎの最大値（秒）")
+    timeout_seconds: float = Field(10.0, gt=0, description="1回の確認のタイムアウト（秒）")
+    window_size: int = Field(20, ge=1, description="エラー率の計算に使用する直近の確認回数")
+    failure_threshold: int = Field(3, ge=1, description="サーキットを開く連続失敗回数")
+    open_seconds: float = Field(60.0, gt=0, description="サーキットを開いてから半開にするまでの秒数")
+
+    @classmethod
+    def from_env(cls) -> "UpstreamProbeConfig":
+        """
+        環境変数から設定を読み込む
+
+        Returns:
+            UpstreamProbeConfigインスタンス
+        """
+        defaults = cls()
+        models_text = os.getenv("UPSTREAM_PROBE_MODELS", "")
+        return cls(
+            enabled=os.getenv("UPSTREAM_PROBE_ENABLED", "true").lower() == "true",
+            models=[model.strip() for model in models_text.split(",") if model.strip()],
+            interval_seconds=float(os.getenv("UPSTREAM_PROBE_INTERVAL_SECONDS", defaults.interval_seconds)),
+            jitter_seconds=float(os.getenv("UPSTREAM_PROBE_JITTER_SECONDS", defaults.jitter_seconds)),
+            timeout_seconds=float(os.getenv("UPSTREAM_PROBE_TIMEOUT_SECONDS", defaults.timeout_seconds)),
+            window_size=int(os.getenv("UPSTREAM_PROBE_WINDOW_SIZE", defaults.window_size)),
+            failure_threshold=int(os.getenv("UPSTREAM_PROBE_FAILURE_THRESHOLD", defaults.failure_threshold)),
+            open_seconds=float(os.getenv("UPSTREAM_PROBE_OPEN_SECONDS", defaults.open_seconds)),
+        )
+
+
+class ModelProbeState:
+    """1モデル分の疎通確認の結果"""
+
+    def __init__(self, model_name: str, window_size: int):
+        """
+        状態を初期化
+
+        Args:
+            model_name: モデル名
+            window_size: エラー率の計算に使用する直近の確認回数
+        """
+        self.model_name = model_name
+        self.circuit_state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_latency_ms: Optional[float] = None
+        self.last_checked_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._results: Deque[bool] = deque(maxlen=window_size)
+
+    @property
+    def error_rate(self) -> Optional[float]:
+        """直近の確認のエラー率（未確認の場合はNone）"""
+        if not self._results:
+            return None
+        return self._results.count(False) / len(self._results)
+
+    def record_success(self, latency_ms: float, now: float) -> None:
+        """成功を記録し、サーキットを閉じる"""
+        self._results.append(True)
+        self.last_latency_ms = latency_ms
+        self.last_checked_at = now
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.circuit_state = CIRCUIT_CLOSED
+        self.opened_at = None
+
+    def record_failure(self, error: str, now: float, failure_threshold: int) -> None:
+        """失敗を記録し、連続失敗回数が閾値に達したらサーキットを開く"""
+        self._results.append(False)
+        self.last_checked_at = now
+        self.last_error = error
+        self.consecutive_failures += 1
+        if self.circuit_state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= failure_threshold:
+            if self.circuit_state != CIRCUIT_OPEN:
+                logger.warning("Upstream circuit opened for model %s: %s", self.model_name, error)
+            self.circuit_state = CIRCUIT_OPEN
+            self.opened_at = now
+
+    def update_circuit(self, now: float, open_seconds: float) -> None:
+        """開いてから一定時間経過したサーキットを半開にする"""
+        if self.circuit_state == CIRCUIT_OPEN and self.opened_at is not None and now - self.opened_at >= open_seconds:
+            self.circuit_state = CIRCUIT_HALF_OPEN
+
+    def to_dict(self) -> Dict[str, Any]:
+        """状態を辞書に変換"""
+        return {
+            "circuit_state": self.circuit_state,
+            "last_latency_ms": self.last_latency_ms,
+            "error_rate": self.error_rate,
+            "consecutive_failures": self.consecutive_failures,
+            "last_checked_at": self.last_checked_at,
+            "last_error": self.last_error,
+        }
+
+
+class UpstreamProber:
+    """各モデルを定期的に確認し、結果をメモリ上に保持するクラス"""
+
+    def __init__(self, config: UpstreamProbeConfig):
+        """
+        疎通確認を初期化
+
+        Args:
+            config: 疎通確認の設定
+        """
+        self.config = config
+        models = config.models
+        if not models:
+            tier_config = get_model_tier_policy().config
+            models = [tier_config.primary_model, tier_config.lite_model]
+        self.states: Dict[str, ModelProbeState] = {
+            model_name: ModelProbeState(model_name, config.window_size) for model_name in models
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def is_ready(self) -> bool:
+        """
+        リクエストを受け付けられるか（いずれかのモデルのサーキットが開いていなければ受付可能）
+
+        Returns:
+            受付可能な場合True
+        """
+        if not self.config.enabled:
+            return True
+        now = time.time()
+        for state in self.states.values():
+            state.update_circuit(now, self.config.open_seconds)
+        return any(state.circuit_state != CIRCUIT_OPEN for state in self.states.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        全モデルの確認結果を取得
+
+        Returns:
+            モデル名と状態の辞書
+        """
+        return {model_name: state.to_dict() for model_name, state in self.states.items()}
+
+    async def probe_once(self) -> None:
+        """全モデルを並行して1回ずつ確認"""
+        await asyncio.gather(*[self._probe_model(state) for state in self.states.values()])
+
+    async def _probe_model(self, state: ModelProbeState) -> None:
+        state.update_circuit(time.time(), self.config.open_seconds)
+        started_at = time.perf_counter()
+        try:
+            vertex_ai_service = get_vertex_ai_service()
+            await asyncio.wait_for(
+                vertex_ai_service.probe_model(state.model_name),
+                timeout=self.config.timeout_seconds
+            )
+            state.record_success((time.perf_counter() - started_at) * 1000, time.time())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            state.record_failure(error, time.time(), self.config.failure_threshold)
+            logger.warning("Upstream probe failed for model %s: %s", state.model_name, error)
+
+    async def _run(self) -> None:
+        # 複数インスタンスが同時に確認しないよう、初回もランダムに遅らせる
+        await asyncio.sleep(random.uniform(0, self.config.jitter_seconds))
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.config.interval_seconds + random.uniform(0, self.config.jitter_seconds))
+
+    def start(self) -> None:
+        """バックグラウンドタスクを開始（サーバー起動時に呼び出す）"""
+        if self.config.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Upstream probe started for models: %s", ', '.join(self.states))
+
+    async def stop(self) -> None:
+        """バックグラウンドタスクを停止（サーバー終了時に呼び出す）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_upstream_prober: Optional[UpstreamProber] = None
+
+
+def get_upstream_prober() -> UpstreamProber:
+    """
+    プロセス共有の疎通確認を取得
+
+    Returns:
+        UpstreamProberインスタンス
+    """
+    global _upstream_prober
+    if _upstream_prober is None:
+        _upstream_prober = UpstreamProber(UpstreamProbeConfig.from_env())
+    return _upstream_prober
@@ -3,10 +3,13 @@ VertexAI gemini-2.5-flashとのやりとりを行う汎用的なサービス
 """
 import logging
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 from io import BytesIO
 from PIL import Image
 from google import genai
+from google.genai import types
+
+from .generation_profile import GenerationProfile
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -35,15 +38,58 @@ class VertexAIService:
                 project=self.project_id,
                 location=self.location
             )
-            logger.info(f"VertexAI initialized with project: {self.project_id}, location: {self.location}, model: {self.model_name}")
+            logger.info("VertexAI initialized with project: %s, location: %s, model: %s", self.project_id, self.location, self.model_name)
         except Exception as e:
-            logger.error(f"VertexAI initialization failed: {str(e)}")
+            logger.error("VertexAI initialization failed: %s", e)
             raise
 
+    async def generate_content_with_usage(
+        self,
+        contents: Union[str, List[Any]],
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
+    ) -> Tuple[str, Dict[str, Optional[int]]]:
+        """
+        生成プロファイルを適用してコンテンツ生成を実行し、トークン使用量と共に返す
+        
+        Args:
+            contents: プロンプト（テキスト、またはテキストと画像のリスト）
+            model_name: 使用するモデル名（省略時はデフォルト）
+            profile: 生成プロファイル（省略時はモデルのデフォルト設定）
+            
+        Returns:
+            生成されたテキストとトークン使用量のタプル
+            
+        Raises:
+            Exception: 空のレスポンスが返された場合
+        """
+        # モデル名の決定
+        used_model = model_name or self.model_name
+        
+        # API呼び出し（Google Gen AI SDKの非同期クライアントを使用し、イベントループをブロックしない）
+        response = await self.client.aio.models.generate_content(
+            model=used_model,
+            contents=contents,
+            config=profile.to_generate_content_config() if profile else None
+        )
+        
+        if not response.text:
+            raise Exception("VertexAIから空のレスポンスが返されました")
+        
+        usage_metadata = response.usage_metadata
+        usage = {
+            "prompt_tokens": usage_metadata.prompt_token_count if usage_metadata else None,
+            "output_tokens": usage_metadata.candidates_token_count if usage_metadata else None,
+            "thinking_tokens": usage_metadata.thoughts_token_count if usage_metadata else None,
+            "total_tokens": usage_metadata.total_token_count if usage_metadata else None,
+        }
+        return response.text, usage
+
     async def generate_text(
         self,
         prompt: str,
-        model_name: Optional[str] = None
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
     ) -> str:
         """
         テキスト生成を実行
@@ -51,6 +97,7 @@ class VertexAIService:
         Args:
             prompt: 生成用プロンプト
             model_name: 使用するモデル名（省略時はデフォルト）
+            profile: 生成プロファイル（省略時はモデルのデフォルト設定）
             
         Returns:
             生成されたテキスト
@@ -59,25 +106,19 @@ class VertexAIService:
             Exception: VertexAI API呼び出しエラー
         """
         try:
-            logger.info(f"VertexAI text generation starting... project={self.project_id}, location={self.location}")
-            
-            # モデル名の決定
-            used_model = model_name or self.model_name
+            logger.info("VertexAI text generation starting... project=%s, location=%s", self.project_id, self.location)
             
-            # API呼び出し（Google Gen AI SDK使用）
-            response = self.client.models.generate_content(
-                model=used_model,
-                contents=prompt
+            response_text, usage = await self.generate_content_with_usage(
+                prompt,
+                model_name=model_name,
+                profile=profile
             )
-            
-            if not response.text:
-                raise Exception("VertexAIから空のレスポンスが返されました")
                 
-            logger.info("VertexAI text generation completed successfully")
-            return response.text
+            logger.info("VertexAI text generation completed successfully", extra={"usage": usage})
+            return response_text
             
         except Exception as e:
-            logger.error(f"VertexAI text generation failed: {str(e)}")
+            logger.error("VertexAI text generation failed: %s", e)
             raise Exception(f"VertexAI テキスト生成に失敗しました: {str(e)}")
 
 
@@ -85,7 +126,8 @@ class VertexAIService:
         self,
         pil_image: Image.Image,
         prompt: str,
-        model_name: Optional[str] = None
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
     ) -> str:
         """
         PIL.Imageとテキストプロンプトを組み合わせて分析を実行（効率化版）
@@ -94,6 +136,7 @@ class VertexAIService:
             pil_image: PIL.Image オブジェクト
             prompt: 分析用プロンプト
             model_name: 使用するモデル名（省略時はデフォルト）
+            profile: 生成プロファイル（省略時はモデルのデフォルト設定）
             
         Returns:
             分析結果テキスト
@@ -102,27 +145,43 @@ class VertexAIService:
             Exception: VertexAI API呼び出しエラー
         """
         try:
-            logger.info(f"VertexAI image analysis starting... project={self.project_id}, location={self.location}")
-            
-            # モデル名の決定
-            used_model = model_name or self.model_name
+            logger.info("VertexAI image analysis starting... project=%s, location=%s", self.project_id, self.location)
             
-            response = self.client.models.generate_content(
-                model=used_model,
-                contents=[prompt, pil_image]
+            response_text, usage = await self.generate_content_with_usage(
+                [prompt, pil_image],
+                model_name=model_name,
+                profile=profile
             )
-            
-            if not response.text:
-                raise Exception("VertexAIから空のレスポンスが返されました")
                 
-            logger.info("VertexAI image analysis completed successfully")
-            return response.text
+            logger.info("VertexAI image analysis completed successfully", extra={"usage": usage})
+            return response_text
             
         except Exception as e:
-            logger.error(f"VertexAI image analysis failed: {str(e)}")
+            logger.error("VertexAI image analysis failed: %s", e)
             raise Exception(f"VertexAI 画像分析に失敗しました: {str(e)}")
 
 
+    async def probe_model(self, model_name: str) -> None:
+        """
+        最小限のリクエストでモデルの疎通を確認（バックグラウンドの死活監視用）
+        
+        思考なし・出力1トークンに制限するため、レスポンスの内容は検証しない
+        
+        Args:
+            model_name: 確認するモデル名
+            
+        Raises:
+            Exception: VertexAI API呼び出しエラー
+        """
+        await self.client.aio.models.generate_content(
+            model=model_name,
+            contents="ping",
+            config=types.GenerateContentConfig(
+                max_output_tokens=1,
+                thinking_config=types.ThinkingConfig(thinking_budget=0)
+            )
+        )
+
     def health_check(self) -> Dict[str, Any]:
         """
         VertexAIサービスのヘルスチェック
@@ -149,7 +208,7 @@ class VertexAIService:
             }
             
         except Exception as e:
-            logger.error(f"Health check failed: {str(e)}")
+            logger.error("Health check failed: %s", e)
             return {
                 "status": "unhealthy",
                 "message": f"VertexAI service error: {str(e)}",
@@ -177,9 +236,12 @@ def create_vertex_ai_service(
     return VertexAIService(project_id=project_id, location=location, model_name=model_name)
 
 
+_vertex_ai_services: Dict[str, VertexAIService] = {}
+
+
 def get_vertex_ai_service(model_name: str = "gemini-2.5-flash") -> VertexAIService:
     """
-    VertexAIサービスインスタンスを取得
+    VertexAIサービスインスタンスを取得（モデル名ごとに1つを使い回し、genaiクライアントを毎回作成しない）
     
     Args:
         model_name: 使用するモデル名（デフォルト: gemini-2.5-flash）
@@ -190,8 +252,13 @@ def get_vertex_ai_service(model_name: str = "gemini-2.5-flash") -> VertexAIServi
     Raises:
         Exception: Google Cloud Project IDが設定されていない場合
     """
+    if model_name in _vertex_ai_services:
+        return _vertex_ai_services[model_name]
+    
     project_id = os.getenv("GOOGLE_CLOUD_PROJECT", "no-smoking-adk-app")
     if not project_id:
         raise Exception("Google Cloud Project IDが設定されていません")
     
-    return create_vertex_ai_service(project_id, model_name=model_name)
\ No newline at end of file
+    vertex_ai_service = create_vertex_ai_service(project_id, model_name=model_name)
+    _vertex_ai_services[model_name] = vertex_ai_service
+    return vertex_ai_service
\ No newline at end of file
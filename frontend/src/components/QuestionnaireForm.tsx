@@ -83,6 +83,8 @@ function QuestionnaireForm() {
 		useState<AnalyzeImageResponse | null>(null);
 	const [error, setError] = useState<string | null>(null);
 	const [base64Image, setBase64Image] = useState<string | null>(null);
+	const [futureImageMimeType, setFutureImageMimeType] =
+		useState<string>("image/png");
 	const [currentImageBase64, setCurrentImageBase64] = useState<string | null>(
 		null
 	);
@@ -151,13 +153,21 @@ function QuestionnaireForm() {
 			// 		response
 			// 	)}、画像解析結果：${JSON.stringify(responseAnalyzeImage)}`
 			// );
+			// サーバー側の先行生成（build_generation_prompt）と同じ形式にすること
 			generateFormData.append(
 				"prompt",
 				`his/her age: ${formData.current_age}, his/her smoking habit: ${formData.daily_cigarettes} cigarettes/day,start smoking: ${formData.smoking_start_age} future predicted effects: ${response.data.predicted_impact}`
 			);
+			// 表示サイズに合わせたWebPで受け取り、転送量を抑える
+			generateFormData.append("output_format", "webp");
+			generateFormData.append("quality", "80");
+			generateFormData.append("max_dimension", "768");
 			const responseGenerateImage = await fetchGenerateImage(generateFormData);
 
 			setBase64Image(responseGenerateImage.image_base64);
+			setFutureImageMimeType(
+				responseGenerateImage.image_mime_type ?? "image/png"
+			);
 			setResult(response);
 			setResponseAnalyzeImage(responseAnalyzeImage);
 		} catch (err) {
@@ -186,6 +196,7 @@ function QuestionnaireForm() {
 			<ResultDisplay
 				currentImage={currentImageBase64}
 				futureImage={base64Image}
+				futureImageMimeType={futureImageMimeType}
 				diagnosisReport={result}
 				onClickReset={() => {
 					setResult(null);
@@ -17,6 +17,7 @@ import type { SmokingCounselingResponse } from "../interface";
 interface ResultDisplayProps {
 	currentImage: string;
 	futureImage: string;
+	futureImageMimeType?: string;
 	diagnosisReport: SmokingCounselingResponse;
 	imageAnalysisResult: string;
 	onClickReset: () => void;
@@ -26,6 +27,7 @@ function ResultDisplay(props: ResultDisplayProps) {
 	const {
 		currentImage,
 		futureImage,
+		futureImageMimeType = "image/png",
 		diagnosisReport,
 		imageAnalysisResult,
 		onClickReset,
@@ -195,7 +197,7 @@ function ResultDisplay(props: ResultDisplayProps) {
 										}}
 									>
 										<img
-											src={`data:image/png;base64,${futureImage}`}
+											src={`data:${futureImageMimeType};base64,${futureImage}`}
 											alt="20年後のあなた"
 											style={{
 												maxWidth: "85%",
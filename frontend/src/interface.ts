@@ -49,6 +49,8 @@ export interface DiagnoseResponse {
 export interface AnalyzeImageResponse {
 	analysis: string;
 	success: boolean;
+	served_tier?: "primary" | "lite";
+	served_model?: string;
 }
 
 /**
@@ -57,6 +59,11 @@ export interface AnalyzeImageResponse {
 export interface GenerateImageResponse {
 	image_base64: string;
 	success: boolean;
+	image_mime_type?: string;
+	width?: number;
+	height?: number;
+	thumbnail_base64?: string | null;
+	speculative?: boolean;
 }
 
 /**
@@ -91,4 +98,6 @@ export interface SmokingCounselingResponse {
 		impact_on_appearance: string;
 		predicted_impact: string;
 	};
+	served_tier?: "primary" | "lite" | "precomputed";
+	served_model?: string;
 }
@@ -112,6 +112,8 @@ export async function fetchHealthStatus(): Promise<HealthStatusResponse> {
 export async function fetchAnalyzeImage(
 	formData: FormData
 ): Promise<AnalyzeImageResponse> {
+	// レート制限をセッション単位で適用するためにセッションIDを付与
+	formData.append("session_id", SESSION_ID);
 	return apiFetch<AnalyzeImageResponse>("/api/analyze-image", {
 		method: "POST",
 		body: formData,
@@ -127,6 +129,8 @@ export async function fetchAnalyzeImage(
 export async function fetchGenerateImage(
 	formData: FormData
 ): Promise<GenerateImageResponse> {
+	// レート制限をセッション単位で適用するためにセッションIDを付与
+	formData.append("session_id", SESSION_ID);
 	return apiFetch<GenerateImageResponse>("/api/generate-image", {
 		method: "POST",
 		body: formData,
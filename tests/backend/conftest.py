@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# Add the backend to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../backend"))
+
+from app.services.diagnose_from_text import SmokingAnalysisRequest
+
+
+@pytest.fixture
+def make_questionnaire():
+    """Build a typical questionnaire, overriding the given fields"""
+    def make(**overrides):
+        fields = dict(
+            current_age=34,
+            gender="male",
+            smoking_start_age=20,
+            daily_cigarettes=19,
+            cigarette_type="通常タバコ",
+            quit_attempts=0,
+            exercise_frequency=2,
+            alcohol_consumption=3,
+            sleep_hours=6.5,
+        )
+        fields.update(overrides)
+        return SmokingAnalysisRequest(**fields)
+
+    return make
@@ -0,0 +1,43 @@
+from app.services.diagnose_from_text import SmokingAnalysisResponse
+from app.services.diagnosis_reuse import DiagnosisReuseConfig, DiagnosisReuseIndex
+
+
+def make_index(make_questionnaire):
+    index = DiagnosisReuseIndex(DiagnosisReuseConfig(enabled=True, max_entries=4))
+    response = SmokingAnalysisResponse(impact_on_appearance="dull skin", predicted_impact="肺機能の低下")
+    index.add(make_questionnaire(), response, served_tier="primary", served_model="gemini-2.5-flash")
+    return index
+
+
+def test_near_questionnaire_reuses_diagnosis(make_questionnaire):
+    """Age 35 and 20 cigarettes fall within the default tolerances of age 34 and 19"""
+    index = make_index(make_questionnaire)
+    reused = index.lookup(make_questionnaire(current_age=35, smoking_start_age=21, daily_cigarettes=20))
+    assert reused is not None
+    assert reused.response.predicted_impact == "肺機能の低下"
+    assert index.metrics()["hit_rate"] == 1.0
+
+
+def test_categorical_features_must_match(make_questionnaire):
+    """A different gender or cigarette type is never reused"""
+    index = make_index(make_questionnaire)
+    assert index.lookup(make_questionnaire(gender="female")) is None
+    assert index.lookup(make_questionnaire(cigarette_type="電子タバコ")) is None
+    assert index.metrics()["hits"] == 0
+
+
+def test_free_text_questionnaires_are_not_reused(make_questionnaire):
+    """Questionnaires with free text fields are neither stored nor served"""
+    index = make_index(make_questionnaire)
+    assert index.lookup(make_questionnaire(previous_medical_advice="禁煙してください")) is None
+    assert index.metrics()["lookups"] == 0
+
+
+def test_index_overwrites_oldest_entries_when_full(make_questionnaire):
+    """The index keeps at most max_entries diagnoses"""
+    index = make_index(make_questionnaire)
+    response = SmokingAnalysisResponse(impact_on_appearance="x", predicted_impact="y")
+    for age in range(60, 66):
+        index.add(make_questionnaire(current_age=age), response, served_tier="lite", served_model="lite")
+    assert len(index) == 4
+    assert index.lookup(make_questionnaire()) is None
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from app.services import generation_profile as generation_profile_module
+from app.services.generation_profile import (
+    DIAGNOSE_ENDPOINT,
+    GenerationProfile,
+    get_profile_for_endpoint,
+    load_profiles,
+    validate_generation_profiles
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_profile_cache(monkeypatch):
+    monkeypatch.setattr(generation_profile_module, "_generation_profiles", None)
+    monkeypatch.delenv("GENERATION_PROFILE_OVERRIDES", raising=False)
+    monkeypatch.delenv("GENERATION_PROFILE_DIAGNOSE", raising=False)
+
+
+def test_overrides_merge_into_builtin_and_add_new_profiles(monkeypatch):
+    """Overrides keep unspecified builtin fields and can define new profiles"""
+    monkeypatch.setenv("GENERATION_PROFILE_OVERRIDES", json.dumps({
+        "concise_json": {"max_output_tokens": 512},
+        "tiny": {"thinking_budget": 0, "max_output_tokens": 64},
+    }))
+    profiles = load_profiles()
+
+    assert profiles["concise_json"].max_output_tokens == 512
+    assert profiles["concise_json"].response_mime_type == "application/json"
+    assert profiles["concise_json"].thinking_budget == 0
+    assert profiles["tiny"].max_output_tokens == 64
+    assert profiles["default"] == GenerationProfile(name="default")
+
+
+def test_endpoint_assignment_can_be_changed(monkeypatch):
+    """GENERATION_PROFILE_<ENDPOINT> selects another profile for the endpoint"""
+    assert get_profile_for_endpoint(DIAGNOSE_ENDPOINT).name == "concise_json"
+    monkeypatch.setattr(generation_profile_module, "_generation_profiles", None)
+    monkeypatch.setenv("GENERATION_PROFILE_DIAGNOSE", "default")
+    assert get_profile_for_endpoint(DIAGNOSE_ENDPOINT).name == "default"
+
+
+def test_profile_converts_to_sdk_config():
+    """Only the configured fields are set on the SDK config"""
+    config = GenerationProfile(
+        name="p", thinking_budget=0, max_output_tokens=256, temperature=0.4, stop_sequences=["END"]
+    ).to_generate_content_config()
+    assert config.thinking_config.thinking_budget == 0
+    assert config.max_output_tokens == 256
+    assert config.temperature == 0.4
+    assert config.stop_sequences == ["END"]
+    assert config.response_mime_type is None
+
+    assert GenerationProfile(name="default").to_generate_content_config().thinking_config is None
+
+
+@pytest.mark.parametrize("overrides, profile_name", [
+    ("not json", None),
+    (json.dumps({"concise_json": {"max_output_tokens": 0}}), None),
+    (json.dumps(["concise_json"]), None),
+    (None, "missing_profile"),
+])
+def test_invalid_configuration_fails_at_startup_as_value_error(monkeypatch, overrides, profile_name):
+    """Misconfiguration raises ValueError (not a request ValidationError) during startup validation"""
+    if overrides is not None:
+        monkeypatch.setenv("GENERATION_PROFILE_OVERRIDES", overrides)
+    if profile_name is not None:
+        monkeypatch.setenv("GENERATION_PROFILE_DIAGNOSE", profile_name)
+    with pytest.raises(ValueError) as exc_info:
+        validate_generation_profiles()
+    assert type(exc_info.value) is ValueError
@@ -0,0 +1,37 @@
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.services.image_encoding import ImageOutputOptions, encode_generated_image
+
+
+def make_generated_png():
+    gradient = np.linspace(0, 255, 1024, dtype=np.uint8)
+    pixels = np.stack([np.tile(gradient, (1024, 1)), np.tile(gradient[:, None], (1, 1024)), np.full((1024, 1024), 128, np.uint8)], axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_png_without_options_is_passed_through():
+    """The default request returns the generated PNG bytes unchanged"""
+    generated = make_generated_png()
+    encoded = encode_generated_image(generated, "image/png", ImageOutputOptions())
+    assert encoded.mime_type == "image/png"
+    assert base64.b64decode(encoded.image_base64) == generated
+    assert (encoded.width, encoded.height) == (1024, 1024)
+
+
+def test_webp_with_max_dimension_and_thumbnail():
+    """WebP output is resized, smaller than the PNG and comes with a thumbnail"""
+    generated = make_generated_png()
+    options = ImageOutputOptions(output_format="webp", quality=80, max_dimension=512, thumbnail_size=96)
+    encoded = encode_generated_image(generated, "image/png", options)
+
+    image_bytes = base64.b64decode(encoded.image_base64)
+    assert encoded.mime_type == "image/webp"
+    assert len(image_bytes) < len(generated)
+    assert Image.open(io.BytesIO(image_bytes)).size == (512, 512)
+    assert Image.open(io.BytesIO(base64.b64decode(encoded.thumbnail_base64))).size == (96, 96)
@@ -0,0 +1,106 @@
+import asyncio
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from app.services.image_quality import (
+    ImageQualityConfig,
+    ImageQualityError,
+    assess_image_quality,
+    ensure_upload_quality,
+    ensure_upload_quality_async
+)
+
+
+def make_face_like_image(width=900, height=1200, face_color=(210, 160, 130)):
+    """Create a textured image with a skin-toned region in the middle"""
+    rng = np.random.default_rng(0)
+    pixels = np.zeros((height, width, 3), dtype=np.float32)
+    pixels[:] = (90, 110, 140)
+    pixels[height // 6:height * 5 // 6, width // 4:width * 3 // 4] = face_color
+    pixels += rng.normal(0, 12, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def test_sharp_face_like_image_passes():
+    """A sharp, well exposed image with skin tones passes the gate"""
+    report = assess_image_quality(make_face_like_image(), ImageQualityConfig())
+    assert report.passed
+    assert report.skin_ratio > 0.1
+
+
+def test_blurry_image_is_rejected():
+    """A heavily blurred image is reported as blurry"""
+    image = make_face_like_image().filter(ImageFilter.GaussianBlur(8))
+    report = assess_image_quality(image, ImageQualityConfig())
+    assert not report.passed
+    assert any("ぼやけ" in issue for issue in report.issues)
+
+
+def test_dark_image_is_rejected():
+    """A nearly black image is reported as too dark"""
+    report = assess_image_quality(Image.new("RGB", (400, 400), (10, 10, 10)), ImageQualityConfig())
+    assert any("暗すぎ" in issue for issue in report.issues)
+
+
+def test_color_image_without_skin_tones_is_rejected():
+    """A color image with no skin-toned region is reported as face-less"""
+    report = assess_image_quality(make_face_like_image(face_color=(60, 170, 90)), ImageQualityConfig())
+    assert report.chroma_spread >= ImageQualityConfig().min_chroma_spread
+    assert any("顔が検出" in issue for issue in report.issues)
+
+
+def test_grayscale_image_skips_the_skin_check():
+    """A black-and-white photo has no chroma, so it is not rejected as face-less"""
+    report = assess_image_quality(make_face_like_image().convert("L"), ImageQualityConfig())
+    assert report.skin_ratio == 0
+    assert report.chroma_spread < ImageQualityConfig().min_chroma_spread
+    assert report.passed
+
+
+def test_ensure_upload_quality_raises_and_rewinds():
+    """Rejected uploads raise ImageQualityError and leave the file at the start"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (400, 400), (10, 10, 10)).save(buffer, format="JPEG")
+    buffer.seek(100)
+
+    with pytest.raises(ImageQualityError):
+        ensure_upload_quality(buffer, ImageQualityConfig())
+    assert buffer.tell() == 0
+
+
+def test_ensure_upload_quality_rejects_broken_data():
+    """Data that cannot be decoded is rejected before any model call"""
+    with pytest.raises(ImageQualityError):
+        ensure_upload_quality(io.BytesIO(b"not an image"), ImageQualityConfig())
+
+
+def test_oversized_png_is_rejected_before_decoding():
+    """Images above max_input_side are rejected from the header without a full decode"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (5000, 100), (200, 150, 120)).save(buffer, format="PNG")
+    buffer.seek(0)
+
+    with pytest.raises(ImageQualityError, match="大きすぎます"):
+        ensure_upload_quality(buffer, ImageQualityConfig())
+    assert buffer.tell() == 0
+
+
+def test_async_gate_checks_png_off_the_event_loop():
+    """The async gate decodes a PNG in a worker thread while the loop keeps running"""
+    buffer = io.BytesIO()
+    make_face_like_image(1200, 1600).convert("RGBA").save(buffer, format="PNG", compress_level=1)
+    buffer.seek(0)
+
+    async def run():
+        ticks = 0
+        check = asyncio.create_task(ensure_upload_quality_async(buffer, ImageQualityConfig()))
+        while not check.done():
+            ticks += 1
+            await asyncio.sleep(0.001)
+        await check
+        return ticks
+
+    assert asyncio.run(run()) > 1
+    assert buffer.tell() == 0
@@ -0,0 +1,182 @@
+import asyncio
+import io
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import generate_image as generate_image_module
+from app.services.image_encoding import ImageOutputOptions, encode_generated_image
+from app.services.memory_budget import (
+    ByteBudget,
+    MemoryBudgetConfig,
+    MemoryBudgetTimeoutError,
+    estimate_image_request_bytes
+)
+from app.services import upstream_probe as upstream_probe_module
+from app.services.upstream_probe import UpstreamProbeConfig, UpstreamProber
+
+
+class FakeModels:
+    """Returns a prebuilt image response instead of calling Vertex AI"""
+
+    def __init__(self, generated_image):
+        self.generated_image = generated_image
+        part = SimpleNamespace(inline_data=SimpleNamespace(mime_type="image/png", data=generated_image))
+        self.response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+        self.calls = 0
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        return self.response
+
+
+@pytest.fixture
+def fake_image_client(monkeypatch):
+    # A noisy 1024x1024 PNG, about 3MB like a large generated image
+    noise = np.random.default_rng(1).integers(0, 256, (1024, 1024, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noise).save(buffer, format="PNG")
+    generated_image = buffer.getvalue()
+    client = SimpleNamespace(aio=SimpleNamespace(models=FakeModels(generated_image)))
+    monkeypatch.setattr(generate_image_module, "_image_generation_client", client)
+    return client
+
+
+def make_upload_jpeg():
+    rng = np.random.default_rng(0)
+    pixels = np.zeros((1200, 900, 3), dtype=np.float32)
+    pixels[:] = (90, 110, 140)
+    pixels[200:1000, 225:675] = (210, 160, 130)
+    pixels += rng.normal(0, 12, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_generation_and_passthrough_encoding_hold_only_the_base64_output(fake_image_client):
+    """Generating and passing a PNG through keeps no extra Python-level copies of the image"""
+    upload = make_upload_jpeg()
+
+    async def run():
+        # asyncio.run自体の確保を含めないよう、イベントループ内で計測する
+        tracemalloc.start()
+        try:
+            generated_image, mime_type = await generate_image_module.generate_image_bytes_from_prompt(
+                "prompt", upload, "image/jpeg"
+            )
+            encoded = encode_generated_image(generated_image, mime_type, ImageOutputOptions())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return encoded, peak
+
+    encoded, peak = asyncio.run(run())
+    # base64のbytesとstrの2つ分＋わずかなオーバーヘッドのみ（生成画像のコピーが1つ増えるだけで超える）
+    # tracemallocはPythonの確保のみを数え、Pillow・SDKのC側のバッファは含まない
+    assert peak < len(encoded.image_base64) * 2 + 512 * 1024
+
+
+def test_generate_image_endpoint_stays_within_reserved_budget(fake_image_client, monkeypatch):
+    """The traced peak of one request fits its input estimate plus the output copies it needs"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    upload = make_upload_jpeg()
+    input_bytes = estimate_image_request_bytes(
+        io.BytesIO(upload),
+        decodes_full_image=True,
+        decodes_jpeg_draft=True
+    )
+
+    # The lifespan runs, but without background probes calling Vertex AI
+    monkeypatch.setattr(
+        upstream_probe_module, "_upstream_prober", UpstreamProber(UpstreamProbeConfig(enabled=False))
+    )
+
+    with TestClient(app) as client:
+        tracemalloc.start()
+        try:
+            response = client.post(
+                "/api/generate-image",
+                data={"prompt": "age 40, 20 cigarettes/day"},
+                files={"file": ("face.jpg", upload, "image/jpeg")}
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert response.status_code == 200
+    base64_size = len(response.json()["image_base64"])
+    # 出力はbase64のbytes・str・JSONレスポンスの3つ分（生成画像はフェイクが保持するため計測外）
+    assert peak < input_bytes + base64_size * 3 + 512 * 1024
+    # 本番では生成画像自体も保持するため、出力用の確保分はそれも含めて足りている必要がある
+    generated_size = len(fake_image_client.aio.models.generated_image)
+    assert generated_size + base64_size * 3 <= MemoryBudgetConfig().generated_image_allowance_bytes
+
+
+def test_estimate_counts_full_decode_only_for_non_jpeg_uploads():
+    """Draft-decoded JPEGs add no pixel bytes, while PNGs add their full RGBA size"""
+    png = io.BytesIO()
+    Image.new("RGB", (2000, 1000)).save(png, format="PNG")
+    jpeg = io.BytesIO(make_upload_jpeg())
+
+    png_estimate = estimate_image_request_bytes(png, decodes_full_image=True, decodes_jpeg_draft=True)
+    jpeg_estimate = estimate_image_request_bytes(jpeg, decodes_full_image=True, decodes_jpeg_draft=True)
+    assert png_estimate == len(png.getvalue()) * 3 + 2000 * 1000 * 4
+    assert jpeg_estimate == len(jpeg.getvalue()) * 3
+
+
+def test_generate_image_rejects_oversized_upload_before_reserving(fake_image_client, monkeypatch):
+    """A small but huge-dimension PNG is refused from its header with 400"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    upload = io.BytesIO()
+    Image.new("RGB", (6000, 6000)).save(upload, format="PNG")
+    monkeypatch.setattr(
+        upstream_probe_module, "_upstream_prober", UpstreamProber(UpstreamProbeConfig(enabled=False))
+    )
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/generate-image",
+            data={"prompt": "age 40, 20 cigarettes/day"},
+            files={"file": ("face.png", upload.getvalue(), "image/png")}
+        )
+
+    assert response.status_code == 400
+    assert "大きすぎます" in response.json()["detail"]
+    assert fake_image_client.aio.models.calls == 0
+
+
+def test_byte_budget_blocks_until_bytes_are_released():
+    """A request that does not fit waits for earlier requests to release their bytes"""
+    async def run():
+        budget = ByteBudget(100)
+        first = await budget.acquire(60)
+        waiter = asyncio.create_task(budget.acquire(60))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        budget.release(first)
+        assert await waiter == 60
+        assert budget.available_bytes == 40
+
+    asyncio.run(run())
+
+
+def test_byte_budget_times_out_and_clamps_oversized_requests():
+    """Oversized requests run alone, and waiting past the timeout raises"""
+    async def run():
+        budget = ByteBudget(100)
+        assert await budget.acquire(500) == 100
+        with pytest.raises(MemoryBudgetTimeoutError):
+            await budget.acquire(10, timeout=0.01)
+        budget.release(100)
+        assert budget.available_bytes == 100
+
+    asyncio.run(run())
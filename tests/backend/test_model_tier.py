@@ -0,0 +1,81 @@
+import asyncio
+
+from app.services.model_tier import LITE_TIER, PRIMARY_TIER, ModelTierConfig, ModelTierPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_policy(**overrides):
+    config = dict(min_deadline_ms=8000, max_queue_depth=2, latency_slo_ms=6000, slo_min_samples=3)
+    config.update(overrides)
+    clock = FakeClock()
+    return ModelTierPolicy(ModelTierConfig(**config), clock=clock), clock
+
+
+def record_primary_call(policy, clock, latency_seconds):
+    async def run():
+        async with policy.track(policy.select()):
+            clock.now += latency_seconds
+
+    asyncio.run(run())
+
+
+def test_short_deadline_selects_lite():
+    """A client deadline below min_deadline_ms goes to the lite model"""
+    policy, _ = make_policy()
+    assert policy.select(remaining_deadline_ms=20000).tier == PRIMARY_TIER
+    decision = policy.select(remaining_deadline_ms=3000)
+    assert decision.tier == LITE_TIER
+    assert decision.reason == "deadline_short(3000ms)"
+
+
+def test_queue_depth_selects_lite_until_calls_finish():
+    """Requests beyond max_queue_depth in-flight calls go to lite"""
+    policy, _ = make_policy()
+
+    async def run():
+        async with policy.track(policy.select()):
+            async with policy.track(policy.select()):
+                assert policy.select().tier == LITE_TIER
+        assert policy.select().tier == PRIMARY_TIER
+
+    asyncio.run(run())
+
+
+def test_slo_violation_selects_lite_and_recovers_through_probes():
+    """After a p90 violation most requests go to lite, and a fast probe restores primary"""
+    policy, clock = make_policy(slo_probe_interval_seconds=10)
+    for _ in range(3):
+        record_primary_call(policy, clock, latency_seconds=10)
+    assert policy.is_slo_violated()
+
+    probe = policy.select()
+    assert (probe.tier, probe.reason) == (PRIMARY_TIER, "slo_probe")
+    assert policy.select().tier == LITE_TIER
+
+    # One fast probe every interval; the slow samples age out and primary returns
+    probes = 0
+    while policy.is_slo_violated():
+        clock.now += 10
+        record_primary_call(policy, clock, latency_seconds=1)
+        probes += 1
+    assert probes <= 13
+    assert policy.select().tier == PRIMARY_TIER
+
+
+def test_slow_samples_expire_by_age():
+    """Old slow samples stop counting once they exceed the sample TTL"""
+    policy, clock = make_policy(slo_sample_ttl_seconds=60)
+    for _ in range(3):
+        record_primary_call(policy, clock, latency_seconds=10)
+    assert policy.is_slo_violated()
+
+    clock.now += 61
+    assert policy.primary_latency_p90_ms() is None
+    assert policy.select().tier == PRIMARY_TIER
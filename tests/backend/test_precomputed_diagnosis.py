@@ -0,0 +1,76 @@
+import json
+import struct
+
+import pytest
+
+from app.services.precomputed_diagnosis import (
+    HEADER_STRUCT,
+    PrecomputedDiagnosisTable,
+    questionnaire_bucket_key,
+    write_precomputed_table
+)
+
+
+def make_payload(text):
+    return json.dumps(
+        {"impact_on_appearance": text, "predicted_impact": text, "model": "gemini-2.5-flash"},
+        ensure_ascii=False
+    ).encode("utf-8")
+
+
+def test_table_round_trip(tmp_path, make_questionnaire):
+    """Entries written by the offline job are served from the memory-mapped table"""
+    path = str(tmp_path / "table.bin")
+    entries = {
+        questionnaire_bucket_key(make_questionnaire(current_age=age, smoking_start_age=18)): make_payload(f"age {age}")
+        for age in range(20, 80, 5)
+    }
+    write_precomputed_table(path, entries)
+
+    table = PrecomputedDiagnosisTable(path)
+    result, model = table.lookup(make_questionnaire(current_age=46, smoking_start_age=18))
+    assert result.predicted_impact == "age 45"
+    assert model == "gemini-2.5-flash"
+    assert table.lookup(make_questionnaire(gender="female")) is None
+    assert table.metrics()["hits"] == 1
+    table.close()
+
+
+def test_table_rejects_other_versions(tmp_path):
+    """A table with a different format version is refused"""
+    path = tmp_path / "table.bin"
+    write_precomputed_table(str(path), {1: make_payload("x")})
+    data = bytearray(path.read_bytes())
+    data[4] = 99
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        PrecomputedDiagnosisTable(str(path))
+
+
+@pytest.mark.parametrize("slot_count, entry_count", [(6, 1), (4, 4), (0, 0)])
+def test_table_rejects_invalid_slot_counts(tmp_path, slot_count, entry_count):
+    """Slot counts that are not a power of two or leave no empty slot are refused"""
+    path = tmp_path / "table.bin"
+    write_precomputed_table(str(path), {1: make_payload("x")})
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<II", data, 8, slot_count, entry_count)
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        PrecomputedDiagnosisTable(str(path))
+
+
+def test_lookup_in_table_without_empty_slots_terminates(tmp_path, make_questionnaire):
+    """A corrupt table whose slots are all occupied returns a miss instead of probing forever"""
+    path = tmp_path / "table.bin"
+    write_precomputed_table(str(path), {1: make_payload("x")})
+    data = bytearray(path.read_bytes())
+    slot_count = struct.unpack_from("<I", data, 8)[0]
+    for index in range(slot_count):
+        struct.pack_into("<I", data, HEADER_STRUCT.size + index * 12, 1)
+    path.write_bytes(bytes(data))
+
+    table = PrecomputedDiagnosisTable(str(path))
+    assert table.lookup(make_questionnaire()) is None
+    table.close()
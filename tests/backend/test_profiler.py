@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+from app.services import profiler as profiler_module
+from app.services.profiler import (
+    ProcessProfiler,
+    ProfilerConfig,
+    sample_stacks,
+    snapshot_allocations
+)
+
+
+def busy_handler(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def run_in_thread(target):
+    stop = threading.Event()
+    thread = threading.Thread(target=target, args=(stop,), name="busy-worker")
+    thread.start()
+    return stop, thread
+
+
+def test_stack_sampling_outputs_collapsed_and_speedscope():
+    """Sampled stacks of other threads are exported in both formats"""
+    stop, thread = run_in_thread(busy_handler)
+    try:
+        profile = sample_stacks(duration_seconds=0.2, interval_seconds=0.005, max_stack_depth=64)
+    finally:
+        stop.set()
+        thread.join()
+
+    collapsed = profile.to_collapsed()
+    busy_lines = [line for line in collapsed.splitlines() if line.startswith("busy-worker;")]
+    assert busy_lines and all("busy_handler (" in line for line in busy_lines)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in busy_lines)
+
+    speedscope = profile.to_speedscope()
+    frames = speedscope["shared"]["frames"]
+    busy_profile = next(p for p in speedscope["profiles"] if p["name"] == "cpu: busy-worker")
+    assert busy_profile["unit"] == "seconds"
+    assert len(busy_profile["samples"]) == len(busy_profile["weights"])
+    assert any(frames[index]["name"].startswith("busy_handler") for index in busy_profile["samples"][0])
+
+
+def test_allocation_snapshot_attributes_retained_memory():
+    """Memory retained during the window is attributed to the allocating line"""
+    retained = []
+
+    def allocate(stop):
+        while not stop.is_set():
+            retained.append(bytearray(10_000))
+            stop.wait(0.001)
+
+    stop, thread = run_in_thread(allocate)
+    try:
+        profile = snapshot_allocations(duration_seconds=0.2, tracemalloc_frames=10)
+    finally:
+        stop.set()
+        thread.join()
+
+    allocation_bytes = sum(
+        weight for (_, frames), weight in profile.stacks.items()
+        if frames and frames[-1][1].endswith("test_profiler.py")
+    )
+    assert profile.unit == "bytes"
+    assert allocation_bytes >= 10_000
+
+
+def test_profile_endpoint_requires_admin_token(monkeypatch):
+    """The endpoint is hidden without a configured token and rejects wrong tokens"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    monkeypatch.setattr(profiler_module, "_process_profiler", ProcessProfiler(ProfilerConfig()))
+    assert client.get("/api/admin/profile").status_code == 404
+
+    monkeypatch.setattr(profiler_module, "_process_profiler", ProcessProfiler(ProfilerConfig(admin_token="secret")))
+    assert client.get("/api/admin/profile", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    response = client.get(
+        "/api/admin/profile",
+        params={"duration_seconds": 0.05, "output_format": "speedscope"},
+        headers={"X-Admin-Token": "secret"}
+    )
+    assert response.status_code == 200
+    assert response.json()["profiles"]
+
+
+def test_only_one_profile_runs_at_a_time():
+    """A second profile request while one is running is rejected"""
+    profiler = ProcessProfiler(ProfilerConfig(admin_token="secret"))
+
+    async def run():
+        first = asyncio.create_task(profiler.run("cpu", 0.1, 0.01))
+        await asyncio.sleep(0)
+        try:
+            await profiler.run("cpu", 0.1, 0.01)
+        except profiler_module.ProfilerBusyError:
+            return await first
+        raise AssertionError("second profile was not rejected")
+
+    assert asyncio.run(run()).stacks
@@ -0,0 +1,94 @@
+import asyncio
+
+from app.services.rate_limit import (
+    InMemoryRateLimitBackend,
+    RateLimitConfig,
+    RateLimiter,
+    resolve_client_ip
+)
+
+
+def consume(backend, key, cost, now, capacity=10.0, refill_per_second=1.0):
+    return asyncio.run(backend.consume([(key, capacity, refill_per_second)], cost, now))[0]
+
+
+def test_bucket_allows_burst_then_rejects_and_refills():
+    """A bucket allows up to its capacity, rejects, then refills over time"""
+    backend = InMemoryRateLimitBackend(max_keys=100, idle_ttl_seconds=600)
+
+    assert consume(backend, "k", 10, now=0).allowed
+    rejected = consume(backend, "k", 1, now=0)
+    assert not rejected.allowed
+    assert rejected.to_headers()["Retry-After"] == "1"
+
+    assert consume(backend, "k", 5, now=5).allowed
+
+
+def test_memory_backend_is_bounded_and_evicts_idle_keys():
+    """The in-memory store never exceeds max_keys and drops idle keys"""
+    backend = InMemoryRateLimitBackend(max_keys=3, idle_ttl_seconds=60)
+    for index in range(10):
+        consume(backend, f"k{index}", 1, now=0)
+    assert len(backend) == 3
+
+    consume(backend, "fresh", 1, now=120)
+    assert len(backend) == 1
+
+
+def test_generate_image_costs_more_than_diagnose():
+    """Endpoint costs drain the shared session bucket at different rates"""
+    config = RateLimitConfig(session_capacity=20, ip_capacity=1000)
+    limiter = RateLimiter(config, InMemoryRateLimitBackend(config.max_keys, config.idle_ttl_seconds))
+
+    async def run():
+        assert (await limiter.check("generate_image", "10.0.0.1", "s1")).allowed
+        assert (await limiter.check("generate_image", "10.0.0.1", "s1")).allowed
+        assert not (await limiter.check("generate_image", "10.0.0.1", "s1")).allowed
+        assert (await limiter.check("diagnose", "10.0.0.1", "s2")).allowed
+
+    asyncio.run(run())
+
+
+def test_rejection_by_one_bucket_consumes_no_tokens_from_the_others():
+    """An IP-bucket rejection leaves the session bucket untouched"""
+    config = RateLimitConfig(
+        session_capacity=30, session_refill_per_second=0.001, ip_capacity=10, ip_refill_per_second=0.001
+    )
+    limiter = RateLimiter(config, InMemoryRateLimitBackend(config.max_keys, config.idle_ttl_seconds))
+
+    async def run():
+        assert (await limiter.check("generate_image", "10.0.0.1", "s1")).allowed
+        for _ in range(2):
+            rejected = await limiter.check("generate_image", "10.0.0.1", "s1")
+            assert not rejected.allowed
+            assert rejected.limit == config.ip_capacity
+        # The session still has 20 tokens, enough for two more generations from fresh IPs
+        assert (await limiter.check("generate_image", "10.0.0.2", "s1")).allowed
+        assert (await limiter.check("generate_image", "10.0.0.3", "s1")).allowed
+        assert not (await limiter.check("generate_image", "10.0.0.4", "s1")).allowed
+
+    asyncio.run(run())
+
+
+def test_client_ip_uses_entry_appended_by_trusted_proxy():
+    """The rightmost trusted-hop entry is used, not the client-supplied leftmost one"""
+    assert resolve_client_ip("1.1.1.1, 203.0.113.7", "10.0.0.1", trusted_proxy_hops=1) == "203.0.113.7"
+    assert resolve_client_ip("1.1.1.1, 203.0.113.7, 35.191.0.1", "10.0.0.1", trusted_proxy_hops=2) == "203.0.113.7"
+    assert resolve_client_ip("203.0.113.7", "10.0.0.1", trusted_proxy_hops=2) == "203.0.113.7"
+    assert resolve_client_ip("1.1.1.1", "10.0.0.1", trusted_proxy_hops=0) == "10.0.0.1"
+    assert resolve_client_ip(None, "10.0.0.1", trusted_proxy_hops=1) == "10.0.0.1"
+
+
+def test_forged_forwarded_for_does_not_get_a_new_bucket():
+    """Rotating the leftmost X-Forwarded-For and session_id still drains the same IP bucket"""
+    config = RateLimitConfig(ip_capacity=30, ip_refill_per_second=0.001)
+    limiter = RateLimiter(config, InMemoryRateLimitBackend(config.max_keys, config.idle_ttl_seconds))
+
+    async def run():
+        results = []
+        for index in range(5):
+            client_ip = resolve_client_ip(f"198.51.100.{index}, 203.0.113.7", "10.0.0.1", config.trusted_proxy_hops)
+            results.append((await limiter.check("generate_image", client_ip, f"session-{index}")).allowed)
+        return results
+
+    assert asyncio.run(run()) == [True, True, True, False, False]
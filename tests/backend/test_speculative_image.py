@@ -0,0 +1,199 @@
+import asyncio
+import io
+
+from app.services.memory_budget import ByteBudget
+from app.services.rate_limit import InMemoryRateLimitBackend, RateLimitConfig, RateLimiter
+from app.services.speculative_image import (
+    SpeculationConfig,
+    SpeculativeImageGenerator,
+    build_generation_prompt
+)
+
+PHOTO = b"photo-bytes" * 100
+PREDICTED_IMPACT = "肺機能の低下"
+
+
+class FakeGenerator:
+    """Counts generation calls and optionally blocks until released"""
+
+    def __init__(self, blocked=False):
+        self.calls = 0
+        self.release = asyncio.Event()
+        if not blocked:
+            self.release.set()
+
+    async def __call__(self, prompt, image_data, mime_type):
+        self.calls += 1
+        await self.release.wait()
+        return b"generated:" + prompt.encode("utf-8"), "image/png"
+
+
+def make_generator(fake, rate_limiter=None, **config):
+    budget = ByteBudget(100 * 1024 * 1024)
+    generator = SpeculativeImageGenerator(
+        SpeculationConfig(enabled=True, **config), budget, 1024 * 1024, generate=fake, rate_limiter=rate_limiter
+    )
+    return generator, budget
+
+
+def record_session(generator, questionnaire, session_id="s1", photo=PHOTO):
+    generator.record_diagnosis(session_id, "203.0.113.7", questionnaire, PREDICTED_IMPACT)
+    generator.record_photo(session_id, "203.0.113.7", io.BytesIO(photo), "image/jpeg")
+
+
+def test_prompt_matches_frontend_format(make_questionnaire):
+    """The server-built prompt matches what QuestionnaireForm sends"""
+    assert build_generation_prompt(make_questionnaire(), PREDICTED_IMPACT) == (
+        "his/her age: 34, his/her smoking habit: 19 cigarettes/day,start smoking: 20 "
+        "future predicted effects: 肺機能の低下"
+    )
+
+
+def test_warm_and_in_flight_results_are_handed_over(make_questionnaire):
+    """A finished job is served warm and a running job is attached to, each generated once"""
+    async def run():
+        fake = FakeGenerator()
+        generator, budget = make_generator(fake)
+        prompt = build_generation_prompt(make_questionnaire(), PREDICTED_IMPACT)
+
+        record_session(generator, make_questionnaire(), "warm")
+        await asyncio.sleep(0)
+        assert await generator.claim("warm", prompt, PHOTO, "image/jpeg") == (b"generated:" + prompt.encode(), "image/png")
+
+        fake.release.clear()
+        record_session(generator, make_questionnaire(), "in-flight")
+        claim = asyncio.create_task(generator.claim("in-flight", prompt, PHOTO, "image/jpeg"))
+        await asyncio.sleep(0)
+        fake.release.set()
+        assert (await claim)[1] == "image/png"
+
+        snapshot = generator.snapshot()
+        assert fake.calls == 2
+        assert (snapshot["warm_hits"], snapshot["in_flight_hits"], snapshot["wasted"]) == (1, 1, 0)
+        assert budget.available_bytes == budget.capacity_bytes
+
+    asyncio.run(run())
+
+
+def test_mismatched_and_replaced_jobs_count_as_wasted(make_questionnaire):
+    """A different prompt or a new photo discards the speculative job and releases its budget"""
+    async def run():
+        fake = FakeGenerator(blocked=True)
+        generator, budget = make_generator(fake)
+        prompt = build_generation_prompt(make_questionnaire(), PREDICTED_IMPACT)
+
+        record_session(generator, make_questionnaire())
+        await asyncio.sleep(0)
+        generator.record_photo("s1", "203.0.113.7", io.BytesIO(b"another photo"), "image/jpeg")
+        await asyncio.sleep(0)
+        assert generator.snapshot()["wasted"] == 1
+
+        assert await generator.claim("s1", "edited prompt", b"another photo", "image/jpeg") is None
+        snapshot = generator.snapshot()
+        assert (snapshot["started"], snapshot["wasted"], snapshot["mismatches"]) == (2, 2, 1)
+        assert snapshot["wasted_ratio"] == 1.0
+        assert await generator.claim("s1", prompt, PHOTO, "image/jpeg") is None
+        assert budget.available_bytes == budget.capacity_bytes
+
+    asyncio.run(run())
+
+
+def test_speculation_limits_defer_and_skip_jobs(make_questionnaire):
+    """Jobs beyond max_inflight wait for a free slot and a busy budget skips speculation"""
+    async def run():
+        fake = FakeGenerator(blocked=True)
+        generator, budget = make_generator(fake, max_inflight=1)
+
+        record_session(generator, make_questionnaire(), "first")
+        record_session(generator, make_questionnaire(), "second")
+        await asyncio.sleep(0)
+        assert (fake.calls, generator.snapshot()["skipped"]) == (1, 1)
+
+        fake.release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert fake.calls == 2
+
+        # Foreground requests hold most of the budget, so no speculation starts
+        await budget.acquire(budget.available_bytes - 1024 * 1024)
+        record_session(generator, make_questionnaire(), "third")
+        assert fake.calls == 2
+        await generator.shutdown()
+
+    asyncio.run(run())
+
+
+def test_speculation_is_charged_to_session_and_ip_buckets(make_questionnaire):
+    """A speculative job pays the generate-image cost and is skipped when a bucket cannot afford it"""
+    async def run():
+        config = RateLimitConfig(session_capacity=15, ip_capacity=15)
+        limiter = RateLimiter(config, InMemoryRateLimitBackend(config.max_keys, config.idle_ttl_seconds))
+        fake = FakeGenerator()
+        generator, budget = make_generator(fake, rate_limiter=limiter)
+        prompt = build_generation_prompt(make_questionnaire(), PREDICTED_IMPACT)
+
+        record_session(generator, make_questionnaire(), "paid")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert generator.is_charged("paid")
+        assert await generator.claim("paid", prompt, PHOTO, "image/jpeg") is not None
+
+        # The shared IP bucket has 5 tokens left, so the second session is not speculated
+        record_session(generator, make_questionnaire(), "unpaid")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert not generator.is_charged("unpaid")
+        assert await generator.claim("unpaid", prompt, PHOTO, "image/jpeg") is None
+
+        snapshot = generator.snapshot()
+        assert fake.calls == 1
+        assert (snapshot["started"], snapshot["rate_limited"], snapshot["wasted"]) == (2, 1, 0)
+        assert budget.available_bytes == budget.capacity_bytes
+
+    asyncio.run(run())
+
+
+def test_photo_swaps_stop_restarting_after_session_limit(make_questionnaire):
+    """Replacing the photo restarts the job only up to max_starts_per_session times"""
+    async def run():
+        fake = FakeGenerator(blocked=True)
+        generator, budget = make_generator(fake, max_starts_per_session=2)
+
+        record_session(generator, make_questionnaire())
+        await asyncio.sleep(0)
+        for index in range(3):
+            generator.record_photo("s1", "203.0.113.7", io.BytesIO(b"photo %d" % index), "image/jpeg")
+            await asyncio.sleep(0)
+
+        snapshot = generator.snapshot()
+        assert fake.calls == 2
+        assert (snapshot["started"], snapshot["restart_limited"], snapshot["in_flight"]) == (2, 2, 0)
+        assert budget.available_bytes == budget.capacity_bytes
+        await generator.shutdown()
+
+    asyncio.run(run())
+
+
+def test_waiting_photos_are_charged_to_the_memory_budget(make_questionnaire):
+    """Photos held before the diagnosis arrives reserve budget and are dropped when it runs low"""
+    async def run():
+        fake = FakeGenerator()
+        budget = ByteBudget(10 * 1024 * 1024)
+        generator = SpeculativeImageGenerator(
+            SpeculationConfig(enabled=True, max_sessions=100), budget, 1024 * 1024, generate=fake
+        )
+        photo = b"p" * (1024 * 1024)
+
+        for index in range(10):
+            generator.record_photo(f"s{index}", "203.0.113.7", io.BytesIO(photo + bytes([index])), "image/jpeg")
+
+        # Only photos that leave min_free_budget_ratio of the budget free are kept
+        snapshot = generator.snapshot()
+        assert snapshot["held_photo_bytes"] == budget.capacity_bytes - budget.available_bytes
+        assert budget.available_bytes >= budget.capacity_bytes * 0.5
+        assert snapshot["skipped"] == 6
+
+        await generator.shutdown()
+        assert budget.available_bytes == budget.capacity_bytes
+
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+import io
+import json
+import logging
+
+import pytest
+
+from app.services.structured_logging import (
+    LoggingConfig,
+    configure_logging,
+    get_logging_metrics,
+    stop_logging
+)
+
+
+@pytest.fixture
+def restore_root_logger():
+    root_logger = logging.getLogger()
+    handlers, level = list(root_logger.handlers), root_logger.level
+    yield
+    stop_logging()
+    root_logger.handlers = handlers
+    root_logger.setLevel(level)
+
+
+def test_records_are_written_as_json_with_redaction(restore_root_logger):
+    """The writer thread emits JSON lines, redacting prompts and truncating long fields"""
+    stream = io.StringIO()
+    configure_logging(LoggingConfig(max_field_length=16), stream=stream)
+
+    logger = logging.getLogger("test.structured")
+    logger.info("Generated for session: %s", "s1", extra={"prompt": "secret habit", "detail": "x" * 100})
+    stop_logging()
+
+    record = json.loads(stream.getvalue().splitlines()[-1])
+    assert record["level"] == "INFO"
+    assert record["message"] == "Generated for session: s1"
+    assert record["prompt"] == "<redacted 12 chars>"
+    assert record["detail"] == "x" * 16 + "...<truncated 84 chars>"
+
+
+def test_info_is_sampled_but_warnings_are_kept(restore_root_logger):
+    """A zero sample rate drops info lines while warnings always pass"""
+    stream = io.StringIO()
+    configure_logging(LoggingConfig(sample_rates={"INFO": 0.0}), stream=stream)
+    sampled_out_before = get_logging_metrics()["sampled_out"]
+
+    logger = logging.getLogger("test.structured")
+    for _ in range(5):
+        logger.info("high volume line")
+    logger.warning("upstream slow")
+    stop_logging()
+
+    messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+    assert messages == ["upstream slow"]
+    assert get_logging_metrics()["sampled_out"] - sampled_out_before == 5
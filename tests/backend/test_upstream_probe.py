@@ -0,0 +1,93 @@
+import asyncio
+
+from app.services import upstream_probe as upstream_probe_module
+from app.services.upstream_probe import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    ModelProbeState,
+    UpstreamProbeConfig,
+    UpstreamProber
+)
+
+
+class FakeVertexAIService:
+    """Fails probes for the models in `failing`"""
+
+    def __init__(self):
+        self.failing = set()
+
+    async def probe_model(self, model_name):
+        if model_name in self.failing:
+            raise RuntimeError(f"{model_name} unavailable")
+
+
+def make_prober(monkeypatch, **config):
+    service = FakeVertexAIService()
+    monkeypatch.setattr(upstream_probe_module, "get_vertex_ai_service", lambda: service)
+    prober = UpstreamProber(UpstreamProbeConfig(models=["primary", "lite"], failure_threshold=3, **config))
+    return prober, service
+
+
+def test_circuit_opens_after_failure_threshold(monkeypatch):
+    """Consecutive failures open the circuit only once the threshold is reached"""
+    prober, service = make_prober(monkeypatch)
+    service.failing = {"primary"}
+
+    for _ in range(2):
+        asyncio.run(prober.probe_once())
+    assert prober.states["primary"].circuit_state == CIRCUIT_CLOSED
+
+    asyncio.run(prober.probe_once())
+    snapshot = prober.snapshot()
+    assert snapshot["primary"]["circuit_state"] == CIRCUIT_OPEN
+    assert snapshot["primary"]["error_rate"] == 1.0
+    assert snapshot["lite"]["circuit_state"] == CIRCUIT_CLOSED
+    assert snapshot["lite"]["error_rate"] == 0.0
+
+
+def test_open_circuit_goes_half_open_and_reopens_on_failure():
+    """After open_seconds the circuit is half-open; one failure reopens it, a success closes it"""
+    state = ModelProbeState("primary", window_size=4)
+    for now in range(3):
+        state.record_failure("timeout", now=now, failure_threshold=3)
+    assert state.circuit_state == CIRCUIT_OPEN
+
+    state.update_circuit(now=30, open_seconds=60)
+    assert state.circuit_state == CIRCUIT_OPEN
+    state.update_circuit(now=62, open_seconds=60)
+    assert state.circuit_state == CIRCUIT_HALF_OPEN
+
+    state.record_failure("timeout", now=63, failure_threshold=3)
+    assert state.circuit_state == CIRCUIT_OPEN
+    assert state.opened_at == 63
+
+    state.update_circuit(now=130, open_seconds=60)
+    state.record_success(latency_ms=120, now=131)
+    assert state.circuit_state == CIRCUIT_CLOSED
+    assert state.error_rate == 0.75
+
+
+def test_ready_returns_503_only_when_every_circuit_is_open(monkeypatch):
+    """Readiness stays 200 while any model's circuit is not open"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    prober, service = make_prober(monkeypatch)
+    monkeypatch.setattr(upstream_probe_module, "_upstream_prober", prober)
+    client = TestClient(app)
+
+    service.failing = {"primary"}
+    for _ in range(3):
+        asyncio.run(prober.probe_once())
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    assert response.json()["upstream"]["primary"]["circuit_state"] == CIRCUIT_OPEN
+
+    service.failing = {"primary", "lite"}
+    for _ in range(3):
+        asyncio.run(prober.probe_once())
+    response = client.get("/api/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
+    assert client.get("/api/health/live").status_code == 200